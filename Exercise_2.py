@@ -1,55 +1,72 @@
-#deque lets us add or remove items from both ends quickly, which is perfect for the breadth-first search (BFS) algorithm because we need to add paths at the end and take paths from the front.
-from collections import deque
-### FUNCTION that prints the labyrinth
+# array = compact list of numbers (4 bytes each instead of a whole Python object per number)
+from array import array
+# re = regular expressions, used to find the runs of free cells in a row quickly
+import re
+# heapq = binary heap (priority queue), A* always continues with the most promising cell
+import heapq
+# sys and time - to report how much memory and time the precomputation takes
+import sys
+import time
+# OrderedDict remembers the order of its keys -> used as a small "least recently used" cache of BFS trees
+from collections import Counter, OrderedDict
+# os, concurrent.futures and shared_memory - to answer a whole file of questions with several processes
+# (all processes read the same labyrinth from shared memory instead of each getting a pickled copy)
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+### FUNCTION that prints the labyrinth (the fast renderer below does the work, with exactly the same output)
 def print_labyrinth(lab: list[str], path: list[tuple[int, int]] = None):
-    # lab = a list of strings
-    # path = An optional list of tuples where each tuple represents a coordinate (row, column) in the labyrinth.
-    # None = man sieht‘s nicht während den Path gesucht wird, sondern nachdem path gefunden wurde, wird das ganze path angezeigt
-    #   it‘s not the type hint here; it is a default value (if the value will not be passed, use this None value)
-
-    # This helper function replaces a character in a string at a specified index. --> replacing spaces with X when finding a path
-    # s = the original string
-    # r = the replacement string
-    # idx = The index at which to replace the character
-    # len - works for replacements that is longer than 1
-    def replace_at_index(s: str, r: str, idx: int) -> str:
-        return s[:idx] + r + s[idx + len(r):]
-        # returns: A new string with the character at idx replaced by r
-
-    #MAIN LOGIC - Column numbers: Generates a string of column numbers for display
-    # n_columns - Determines the number of columns in the labyrinth by checking the length of the first row
-    # numbers - Creates a string of column numbers, where each number is the column iπndex modulo 10 (to keep it within a single digit).
-    n_columns = len(lab[0])
-    numbers = " " + "".join([str(i % 10) for i in range(n_columns)])
-    # " " -> leeren Platz am anfang der Zeile mit den Nummern
-    # "" -> damit zwischen den Zahlen kein Platz wird
-
-    # prints the column numbers above the labyrinth
-    print(numbers)
-
-    # ROW PROCESSING: Iterates through each row of the labyrinth
-    #iterate through each index of every row of the labyrinth; enumerate function iterates over lab (= list of coordinates, consisting of tuples) and
-    # keeps track of both the index and the value of each item in this list
-    # enumerate return us a tuple of indexes of the items and the value
-    for i, row in enumerate(lab):
-        # if a path is found / if the path is not None (= if the path variable contains any value or elements / whether this list is empty or not) than...
-        if path:
-            # iterate through every item (every tuple in the list of this path, = every coordinate, f.e. (3,3))
-            for item in path:
-                # checks if the current row of the path matches the current row being printed. If it does, it replaces the character at the specified
-                #   column (item[1]) with "X" in the current row to mark that position as part of the path.(use the defined function replace_at_index in
-                #   order to) mark it with 'X'
-                #item[0] = This represents the row number of the current coordinate in the path. For example, if item is (1, 4), then item[0] is 1.
-                #i = row number; This is the current row index of the labyrinth as you loop through it using enumerate.
-                if item[0] == i: # literally checking "Is there a part of the path on this row?"
-                    row = replace_at_index(row, "X", item[1])
-
-        # Prints the row of the labyrinth with its index (= row numbers) on both sides
-        # index = a number from 0 to 9
-        print(f"{i %10}{row}{i % 10}")
-
-    # prints the numbers below the laryrinth
-    print(numbers)
+    write_labyrinth(lab, path)
+
+
+### FUNCTION: builds the whole picture of the labyrinth as ONE string
+# the original version (a replace for every path cell) went through the whole path for every row and rebuilt the row string
+#   for every hit -> rows * path length * row width; here:
+# 1. all rows are copied into one mutable buffer (a list of single characters) - once
+# 2. every path coordinate is stamped as 'X' directly at its position in the buffer - one pass over the path
+# 3. the buffer is joined into one string - once
+# viewport = (first_row, first_column, number_of_rows, number_of_columns): only this part is drawn (for huge labyrinths);
+#   the row and column numbers are still the real ones
+def render_labyrinth(lab: list[str], path: list[tuple[int, int]] = None, viewport: tuple[int, int, int, int] = None) -> str:
+    n_rows = len(lab)
+    n_columns = len(lab[0]) if lab else 0
+    first_row, first_column, height, width = viewport if viewport else (0, 0, n_rows, n_columns)
+    # the viewport may not reach outside of the labyrinth
+    first_row, first_column = max(first_row, 0), max(first_column, 0)
+    last_row, last_column = min(first_row + height, n_rows), min(first_column + width, n_columns)
+
+    numbers = " " + "".join([str(i % 10) for i in range(first_column, last_column)]) + "\n"
+
+    # every line in the buffer: row number + the visible cells + row number + newline
+    line_length = (last_column - first_column) + 3
+    buffer = []
+    for i in range(first_row, last_row):
+        digit = str(i % 10)
+        buffer.append(digit)
+        buffer.extend(lab[i][first_column:last_column])  # adds the characters one by one, in one call
+        buffer.append(digit)
+        buffer.append("\n")
+
+    if path:
+        for row, column in path:
+            if first_row <= row < last_row and first_column <= column < last_column:
+                buffer[(row - first_row) * line_length + 1 + (column - first_column)] = "X"
+
+    return numbers + "".join(buffer) + numbers
+
+
+### FUNCTION: writes the picture with a single write call (to the screen, or to any open file / log stream)
+def write_labyrinth(lab: list[str], path: list[tuple[int, int]] = None, viewport: tuple[int, int, int, int] = None, file=None):
+    (file or sys.stdout).write(render_labyrinth(lab, path, viewport))
+
+
+### FUNCTION: a viewport around the path ("crop mode"): only the part of a huge labyrinth where the path is, plus a margin
+def path_viewport(path: list[tuple[int, int]], margin: int = 2) -> tuple[int, int, int, int]:
+    rows = [row for row, _ in path]
+    columns = [column for _, column in path]
+    first_row = max(min(rows) - margin, 0)
+    first_column = max(min(columns) - margin, 0)
+    return first_row, first_column, max(rows) + margin + 1 - first_row, max(columns) + margin + 1 - first_column
 
 
 ### FUNCTION: Prompts the user to input an integer and validates the input.
@@ -77,54 +94,24 @@ def prompt_user_for_location(name: str) -> tuple[int, int]:
 
 
 ### BFS function to traverse a graph
+# The actual search is done by the CompiledLabyrinth class below (no path copies, cells are marked when enqueued)
 def bfs(lab: list[str], start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
-    # ... your implementation here...
-    # Create a queue to hold all paths we considered up until now
-    queue = deque ()
-    # we enqueue start path (a queue with just the start location in it)
-    queue.append([start])
-
-    # Creating a set that holds all the locations that we have already visited
-    visited_locations = set()
-
-    # Continue the search while there are paths in the queue
-    while queue:
-        # dequeue the first path in the queue using pop (because index is known --> [0] --> first path in the queue)
-        path = queue.popleft()
-        # Get the last location in the current path
-        last = path[-1]
-
-        # Check if we've reached the end location
-        # when the last location in our path equals the desired end location, we found a path
-        if last == end:
-            # Return the complete path to the end
-            return path
+    return CompiledLabyrinth(lab).bfs(start, end)
+
 
-        # if ‘last‘ is not in our set (= all visited locations), add it to the set
-        if last not in visited_locations:
-            visited_locations.add(last)
+### Alternative solvers with the same call signature as bfs - they find a path of the same (shortest) length,
+#   but usually look at far fewer cells; if there are several shortest paths, they may pick a different one
+def astar(lab: list[str], start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+    return CompiledLabyrinth(lab).astar(start, end)
 
-        # Define the possible moves (right, left, down, up)
-        moves = [(0, 1), (0, -1), (1, 0), (-1, 0)]
 
-        # Explore each possible move (= calculate the next position)
-        # This loop iterates over each of the moves above, applying them one by one to the current position.
-        for move in moves:
-            # Here, last represents the last position in the current path, and it’s a tuple (row, col).
-            # By adding move[0] to last[0] (the row coordinate) and move[1] to last[1] (the column coordinate), we calculate the
-            #   row and column of the next location
-            next_row = last[0] + move[0]
-            next_column = last[1] + move [1]
-            # next_location is then formed as a tuple (next_row, next_col) to represent this new position.
-            next_location = (next_row, next_column)
-            # instead of the previous four rows: next_location = (last + move)
+def bidirectional_bfs(lab: list[str], start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+    return CompiledLabyrinth(lab).bidirectional_bfs(start, end)
 
-            if is_traversible(lab, next_location):
-                next_path = path + [next_location]  # creating new possible path
-                queue.append(next_path)  # adding to the queue
 
-    # If there is no path found, return an empty list
-    return []
+# all solvers by name, e.g. SOLVERS["astar"](labyrinth, start_location, end_location)
+SOLVERS = {"bfs": bfs, "astar": astar, "bidirectional": bidirectional_bfs}
+
 
 def is_traversible(lab: list[str], location: tuple[int, int]) -> bool:
     # check if location is in labyrinth
@@ -137,6 +124,674 @@ def is_traversible(lab: list[str], location: tuple[int, int]) -> bool:
 
 
 
+### CLASS: the labyrinth "compiled" once into a flat bytearray, so searches don't work on strings and tuples
+# - every cell is one byte: 1 = traversable (" "), 0 = wall
+# - a cell (row, column) becomes one integer index: (row + 1) * width + (column + 1)
+# - the labyrinth gets a border of walls around it (that's the + 1), so a neighbour can never be outside the grid
+#   and we don't need any bounds checks while searching
+class CompiledLabyrinth:
+    def __init__(self, lab: list[str]):
+        self.rows = len(lab)
+        self.columns = len(lab[0]) if lab else 0
+        self.width = self.columns + 2  # width of one row including the two border walls
+        self.cells = bytearray(self.width * (self.rows + 2))  # all walls at first
+
+        for row, line in enumerate(lab):
+            row_start = (row + 1) * self.width + 1
+            # only the free cells have to be written: mark every run of spaces at once
+            for match in re.finditer(" +", line):
+                self.cells[row_start + match.start():row_start + match.end()] = b"\x01" * (match.end() - match.start())
+
+        # Moves (right, left, down, up) as index offsets - same order as in the original bfs
+        self.offsets = (1, -1, self.width, -self.width)
+
+        # how many cells the last search expanded (= took out of its queue) - to compare the solvers
+        self.expanded = 0
+
+    @classmethod
+    def from_cells(cls, rows: int, columns: int, cells) -> "CompiledLabyrinth":
+        # builds the object around already compiled cells (e.g. a shared memory buffer) without copying them
+        grid = cls([])
+        grid.rows, grid.columns, grid.width = rows, columns, columns + 2
+        grid.cells = cells
+        grid.offsets = (1, -1, grid.width, -grid.width)
+        return grid
+
+    def contains(self, location: tuple[int, int]) -> bool:
+        row, column = location
+        return 0 <= row < self.rows and 0 <= column < self.columns
+
+    def index_of(self, location: tuple[int, int]) -> int:
+        row, column = location
+        return (row + 1) * self.width + column + 1
+
+    def location_of(self, index: int) -> tuple[int, int]:
+        return index // self.width - 1, index % self.width - 1
+
+    def is_traversible(self, location: tuple[int, int]) -> bool:
+        return self.contains(location) and self.cells[self.index_of(location)] == 1
+
+    def bfs(self, start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+        # same results as the original bfs: the path from start to end (both included), or [] if there is none
+        if start == end:
+            return [start]
+        if not (self.contains(start) and self.contains(end)):
+            return []
+
+        source = self.index_of(start)
+        target = self.index_of(end)
+        cells = self.cells
+        offsets = self.offsets
+
+        # parent[i] = the cell we came from to reach cell i; -1 = not visited yet
+        # -> instead of storing a whole path per queue entry, every cell only remembers one number
+        parent = array("i", [-1]) * len(cells)
+        parent[source] = source
+
+        # the queue is a plain array of cell indexes; 'head' points at the next cell to dequeue
+        # (every cell is enqueued at most once, because it is marked as visited right when it is enqueued)
+        queue = array("i", [source])
+        head = 0
+
+        while head < len(queue):
+            current = queue[head]
+            head += 1
+            for offset in offsets:
+                neighbour = current + offset
+                if cells[neighbour] and parent[neighbour] == -1:
+                    parent[neighbour] = current
+                    if neighbour == target:
+                        self.expanded = head
+                        return self.reconstruct_path(parent, source, target)
+                    queue.append(neighbour)
+
+        # If there is no path found, return an empty list
+        self.expanded = head
+        return []
+
+    def astar(self, start: tuple[int, int], end: tuple[int, int], heuristic=None) -> list[tuple[int, int]]:
+        # A*: like BFS, but always expand the cell with the smallest  f = g + h
+        #   g = number of steps from start to the cell (known)
+        #   h = Manhattan distance from the cell to end (|row difference| + |column difference|) - a guess that
+        #       is never too high, so the first time we take 'end' out of the heap we have a shortest path
+        # heuristic = optional function(cell index) -> h, to use a better guess (it must never be too high either)
+        if start == end:
+            return [start]
+        if not (self.contains(start) and self.contains(end)):
+            return []
+
+        source = self.index_of(start)
+        target = self.index_of(end)
+        target_row, target_column = divmod(target, self.width)
+        cells = self.cells
+        offsets = self.offsets
+        width = self.width
+
+        parent = array("i", [-1]) * len(cells)
+        steps = array("i", [-1]) * len(cells)  # g of every cell reached so far (-1 = not reached)
+        parent[source] = source
+        steps[source] = 0
+
+        if heuristic is None:
+            def heuristic(cell: int) -> int:
+                row, column = divmod(cell, width)
+                return abs(row - target_row) + abs(column - target_column)
+
+        # heap entries: (f, -g, cell) -> on equal f, the cell that is further along (bigger g) comes first
+        open_set = [(heuristic(source), 0, source)]
+        self.expanded = 0
+
+        while open_set:
+            _, negative_g, current = heapq.heappop(open_set)
+            g = -negative_g
+            if g > steps[current]:
+                continue  # an old heap entry, this cell was reached on a shorter way in the meantime
+            self.expanded += 1
+            if current == target:
+                return self.reconstruct_path(parent, source, target)
+
+            for offset in offsets:
+                neighbour = current + offset
+                if cells[neighbour] and (steps[neighbour] == -1 or g + 1 < steps[neighbour]):
+                    steps[neighbour] = g + 1
+                    parent[neighbour] = current
+                    heapq.heappush(open_set, (g + 1 + heuristic(neighbour), -(g + 1), neighbour))
+
+        # If there is no path found, return an empty list
+        return []
+
+    def bidirectional_bfs(self, start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+        # two BFS at once: one from start, one from end, always growing the smaller frontier by one whole layer
+        # -> they meet in the middle; each only has to search about half the distance
+        if start == end:
+            return [start]
+        if not (self.contains(start) and self.contains(end)):
+            return []
+        target = self.index_of(end)
+        if not self.cells[target]:
+            return []  # like in bfs: the end has to be a free cell (only the start may be a wall)
+
+        source = self.index_of(start)
+        size = len(self.cells)
+        # forward search (from start) and backward search (from end): parent and distance of every cell
+        parent_forward, parent_backward = array("i", [-1]) * size, array("i", [-1]) * size
+        distance_forward, distance_backward = array("i", [-1]) * size, array("i", [-1]) * size
+        parent_forward[source] = source
+        distance_forward[source] = 0
+        parent_backward[target] = target
+        distance_backward[target] = 0
+
+        frontier_forward = [source]
+        frontier_backward = [target]
+        self.expanded = 0
+
+        while frontier_forward and frontier_backward:
+            if len(frontier_forward) <= len(frontier_backward):
+                frontier_forward, meeting = self.expand_layer(frontier_forward, parent_forward,
+                                                              distance_forward, distance_backward)
+                if meeting:
+                    forward_cell, backward_cell = meeting
+            else:
+                frontier_backward, meeting = self.expand_layer(frontier_backward, parent_backward,
+                                                               distance_backward, distance_forward)
+                if meeting:
+                    backward_cell, forward_cell = meeting
+            if meeting:
+                # start -> forward_cell (following the forward parents, then reversed) ...
+                path = self.reconstruct_path(parent_forward, source, forward_cell)
+                # ... -> backward_cell -> end (following the backward parents)
+                current = backward_cell
+                path.append(self.location_of(current))
+                while current != target:
+                    current = parent_backward[current]
+                    path.append(self.location_of(current))
+                return path
+
+        # If there is no path found, return an empty list
+        return []
+
+    def expand_layer(self, frontier: list[int], parent: array, distance: array, other_distance: array):
+        # expands one whole BFS layer of one side
+        # returns the next layer, and the step (cell of this side, cell of the other side) where the two
+        #   searches meet on the shortest total path - or None if they didn't meet
+        # (the whole layer is expanded before we stop: stopping at the very first meeting could miss a shorter path)
+        cells = self.cells
+        next_frontier = []
+        meeting = None
+        best_length = -1
+        for current in frontier:
+            self.expanded += 1
+            for offset in self.offsets:
+                neighbour = current + offset
+                if other_distance[neighbour] != -1:
+                    # the other side has already been here: the two searches meet
+                    length = distance[current] + 1 + other_distance[neighbour]
+                    if best_length == -1 or length < best_length:
+                        meeting = (current, neighbour)
+                        best_length = length
+                elif cells[neighbour] and parent[neighbour] == -1:
+                    parent[neighbour] = current
+                    distance[neighbour] = distance[current] + 1
+                    next_frontier.append(neighbour)
+        return next_frontier, meeting
+
+    def bfs_tree(self, source: int) -> tuple[array, array]:
+        # a complete BFS from one cell index (no end): the distance and the parent of every reachable cell
+        # (-1 = not reachable); with this "BFS tree" every path from the source is just a lookup
+        cells = self.cells
+        distance = array("i", [-1]) * len(cells)
+        parent = array("i", [-1]) * len(cells)
+        distance[source] = 0
+        parent[source] = source
+        queue = array("i", [source])
+        head = 0
+        while head < len(queue):
+            current = queue[head]
+            head += 1
+            for offset in self.offsets:
+                neighbour = current + offset
+                if cells[neighbour] and parent[neighbour] == -1:
+                    parent[neighbour] = current
+                    distance[neighbour] = distance[current] + 1
+                    queue.append(neighbour)
+        return distance, parent
+
+    def reconstruct_path(self, parent: array, source: int, target: int) -> list[tuple[int, int]]:
+        # follow the parent "pointers" back from the end to the start - only done once, at the very end
+        path = [self.location_of(target)]
+        current = target
+        while current != source:
+            current = parent[current]
+            path.append(self.location_of(current))
+        path.reverse()
+        return path
+
+
+### CLASS: precomputed data for MANY start/end questions on the same (unchanging) labyrinth
+# - components: every free cell gets the number of its connected area -> "no path" is answered immediately
+# - corridor graph: cells with exactly 2 free neighbours (corridors) are collapsed; only junctions and dead ends
+#   are nodes, connected by edges weighted with the corridor length -> a path search only visits the junctions
+# - landmarks: full BFS distances from a few far-apart cells -> a much better A* guess (the "ALT" heuristic):
+#   the distance from a cell to end is at least |d(landmark, end) - d(landmark, cell)|
+#   (only built with corridors=False - otherwise A* is never used)
+# - cached BFS trees: the last 'cache_size' complete BFS trees -> questions from/to those cells are a lookup
+#   (a start that is asked for twice gets its tree cached automatically)
+# report() tells how long each part took to build and how much memory it uses
+class PrecomputedLabyrinth:
+    def __init__(self, lab: list[str], landmarks: int = 4, corridors: bool = True, cache_size: int = 8):
+        # lab can also be an already CompiledLabyrinth
+        self.grid = lab if isinstance(lab, CompiledLabyrinth) else CompiledLabyrinth(lab)
+        self.cache_size = cache_size
+        self.trees = OrderedDict()  # cell index -> (distance, parent) of a BFS tree, least recently used first
+        self.recent_sources = OrderedDict()  # start cells of the last queries, to notice repeated starts
+        self.landmarks = []  # list of (cell index, distance array)
+        self.build_seconds = {}
+
+        started = time.perf_counter()
+        self.build_components()
+        self.build_seconds["components"] = time.perf_counter() - started
+
+        self.corridors = corridors
+        if corridors:
+            started = time.perf_counter()
+            self.build_corridor_graph()
+            self.build_seconds["corridor graph"] = time.perf_counter() - started
+        else:
+            # the landmarks are only used by A* - with the corridor graph they would never be looked at
+            started = time.perf_counter()
+            self.build_landmarks(landmarks)
+            self.build_seconds["landmarks"] = time.perf_counter() - started
+
+    def build_components(self):
+        # component[i] = number of the connected area of free cell i (0 = wall)
+        cells = self.grid.cells
+        self.component = array("i", [0]) * len(cells)
+        count = 0
+        for cell in range(len(cells)):
+            if cells[cell] and not self.component[cell]:
+                count += 1
+                self.component[cell] = count
+                stack = [cell]  # flood fill (order doesn't matter here, so a stack is enough)
+                while stack:
+                    current = stack.pop()
+                    for offset in self.grid.offsets:
+                        neighbour = current + offset
+                        if cells[neighbour] and not self.component[neighbour]:
+                            self.component[neighbour] = count
+                            stack.append(neighbour)
+        self.component_count = count
+
+    def build_landmarks(self, count: int):
+        # "farthest point" selection: each new landmark is the cell farthest away from all landmarks chosen so far
+        # (only inside the biggest area - landmarks in different areas would know nothing about each other)
+        sizes = Counter(self.component)
+        del sizes[0]  # walls
+        if count <= 0 or not sizes:
+            return
+        biggest = max(sizes, key=sizes.get)
+
+        # start from the cell farthest away from some first cell of the area
+        # (cells outside the area have distance -1, so they are never picked and stay -1 in nearest)
+        nearest, _ = self.grid.bfs_tree(self.component.index(biggest))  # distance to the nearest landmark so far
+        for _ in range(min(count, sizes[biggest])):
+            landmark = nearest.index(max(nearest))
+            distance, _ = self.grid.bfs_tree(landmark)
+            self.landmarks.append((landmark, distance))
+            nearest = distance if len(self.landmarks) == 1 else array("i", map(min, nearest, distance))
+
+    def build_corridor_graph(self):
+        cells = self.grid.cells
+        offsets = self.grid.offsets
+        size = len(cells)
+
+        def degree(cell: int) -> int:
+            return sum(cells[cell + offset] for offset in offsets)
+
+        # node[i] = node number of cell i (-1 = not a node); nodes are free cells WITHOUT exactly 2 free neighbours
+        self.node = array("i", [-1]) * size
+        self.node_cells = []
+        for cell in range(size):
+            if cells[cell] and degree(cell) != 2:
+                self.node[cell] = len(self.node_cells)
+                self.node_cells.append(cell)
+
+        # every corridor cell knows its edge and its position inside the edge
+        self.edge_of = array("i", [-1]) * size
+        self.position = array("i", [0]) * size
+        self.edges = []      # (node a, node b, corridor cells from a to b) - edge weight = len(cells) + 1
+        self.adjacent = []   # adjacent[node] = list of (other node, weight, edge number)
+
+        def walk_from(node_cell: int):
+            for offset in offsets:
+                first = node_cell + offset
+                if not cells[first] or self.edge_of[first] != -1:
+                    continue
+                if self.node[first] != -1:
+                    if node_cell < first:  # two neighbouring nodes: an edge without corridor cells (add it once)
+                        self.add_edge(self.node[node_cell], self.node[first], array("i"))
+                    continue
+                # follow the corridor until we reach a node again
+                corridor = array("i")
+                previous, current = node_cell, first
+                while self.node[current] == -1:
+                    self.edge_of[current] = len(self.edges)
+                    self.position[current] = len(corridor)
+                    corridor.append(current)
+                    # a corridor cell has exactly 2 free neighbours: continue with the one we didn't come from
+                    following = next(current + o for o in offsets if cells[current + o] and current + o != previous)
+                    previous, current = current, following
+                self.add_edge(self.node[node_cell], self.node[current], corridor)
+
+        self.adjacent = [[] for _ in self.node_cells]
+        for node_cell in list(self.node_cells):
+            walk_from(node_cell)
+
+        # closed loops made only of corridor cells have no node at all: make one of their cells a node
+        for cell in range(size):
+            if cells[cell] and self.node[cell] == -1 and self.edge_of[cell] == -1:
+                self.node[cell] = len(self.node_cells)
+                self.node_cells.append(cell)
+                self.adjacent.append([])
+                walk_from(cell)
+
+    def add_edge(self, a: int, b: int, corridor: array):
+        number = len(self.edges)
+        self.edges.append((a, b, corridor))
+        if a != b:  # a loop back to the same node never makes a path shorter
+            self.adjacent[a].append((b, len(corridor) + 1, number))
+            self.adjacent[b].append((a, len(corridor) + 1, number))
+
+    def report(self) -> dict:
+        # build time (seconds) and approximate memory (bytes) of every precomputed part
+        def array_bytes(*arrays) -> int:
+            return sum(a.itemsize * len(a) for a in arrays)
+
+        memory = {
+            "grid": len(self.grid.cells),
+            "components": array_bytes(self.component),
+            "landmarks": array_bytes(*(distance for _, distance in self.landmarks)),
+            "cached trees": sum(array_bytes(distance, parent) for distance, parent in self.trees.values()),
+        }
+        if self.corridors:
+            memory["corridor graph"] = (array_bytes(self.node, self.edge_of, self.position)
+                                        + sum(array_bytes(corridor) + sys.getsizeof((a, b, corridor))
+                                              for a, b, corridor in self.edges)
+                                        + sum(sys.getsizeof(neighbours) for neighbours in self.adjacent))
+        return {
+            "cells": self.grid.rows * self.grid.columns,
+            "components": self.component_count,
+            "landmarks": len(self.landmarks),
+            "corridor nodes": len(self.node_cells) if self.corridors else 0,
+            "corridor edges": len(self.edges) if self.corridors else 0,
+            "cached trees": len(self.trees),
+            "build seconds": dict(self.build_seconds),
+            "memory bytes": memory,
+            "total memory bytes": sum(memory.values()),
+        }
+
+    def tree(self, location: tuple[int, int]) -> tuple[array, array]:
+        # the complete BFS tree of a cell, computed once and then kept in the cache
+        return self.cached_tree(self.grid.index_of(location))
+
+    def cached_tree(self, source: int) -> tuple[array, array]:
+        if source in self.trees:
+            self.trees.move_to_end(source)  # recently used -> evicted last
+        else:
+            self.trees[source] = self.grid.bfs_tree(source)
+            if len(self.trees) > self.cache_size:
+                self.trees.popitem(last=False)
+        return self.trees[source]
+
+    def distance(self, start: tuple[int, int], end: tuple[int, int]) -> int:
+        # number of steps on a shortest path, -1 if there is none
+        return len(self.shortest_path(start, end)) - 1
+
+    def shortest_path(self, start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+        # same answer (length) as bfs, using the cheapest way the precomputed data allows
+        grid = self.grid
+        if start == end:
+            return [start]
+        if not (grid.contains(start) and grid.contains(end)):
+            return []
+        source = grid.index_of(start)
+        target = grid.index_of(end)
+        if not grid.cells[source]:
+            return grid.bfs(start, end)  # the start is a wall - a rare case, the plain BFS handles it like before
+        if not grid.cells[target] or self.component[source] != self.component[target]:
+            return []  # different areas: there is no path
+
+        # 1. a cached BFS tree of start or end: just follow the parents
+        if source in self.trees:
+            self.trees.move_to_end(source)
+            return grid.reconstruct_path(self.trees[source][1], source, target)
+        if target in self.trees:
+            self.trees.move_to_end(target)
+            path = grid.reconstruct_path(self.trees[target][1], target, source)
+            path.reverse()
+            return path
+
+        # 2. the same start was asked for a moment ago: it will probably be asked again, so keep its whole tree
+        if source in self.recent_sources:
+            del self.recent_sources[source]
+            return grid.reconstruct_path(self.cached_tree(source)[1], source, target)
+        self.recent_sources[source] = None
+        if len(self.recent_sources) > 4 * self.cache_size:
+            self.recent_sources.popitem(last=False)
+
+        # 3. a small search on the corridor graph
+        if self.corridors:
+            return self.corridor_path(source, target)
+
+        # 4. A* with the landmark distances as guess
+        return grid.astar(start, end, heuristic=self.landmark_heuristic(target))
+
+    def landmark_heuristic(self, target: int):
+        width = self.grid.width
+        target_row, target_column = divmod(target, width)
+        tables = [(distance, distance[target]) for _, distance in self.landmarks if distance[target] != -1]
+
+        def heuristic(cell: int) -> int:
+            row, column = divmod(cell, width)
+            guess = abs(row - target_row) + abs(column - target_column)
+            for distance, to_target in tables:
+                guess = max(guess, abs(to_target - distance[cell]))
+            return guess
+        return heuristic
+
+    def attachments(self, cell: int) -> list[tuple[int, int]]:
+        # the nodes a cell is attached to, with their distance: a node itself, or both ends of its corridor
+        if self.node[cell] != -1:
+            return [(self.node[cell], 0)]
+        a, b, corridor = self.edges[self.edge_of[cell]]
+        position = self.position[cell]
+        return [(a, position + 1), (b, len(corridor) - position)]
+
+    def corridor_path(self, source: int, target: int) -> list[tuple[int, int]]:
+        # Dijkstra from the start's node(s) on the corridor graph, until no shorter way to the end is possible
+        best_length = -1
+        best_end = None  # (node the path arrives at, or None if it goes straight along one corridor)
+        if self.node[source] == -1 and self.edge_of[source] == self.edge_of[target] and self.node[target] == -1:
+            # both in the same corridor: the direct way is a candidate (going around might still be shorter)
+            best_length = abs(self.position[source] - self.position[target])
+
+        target_attachments = dict()
+        for node, length in self.attachments(target):
+            if node not in target_attachments or length < target_attachments[node]:
+                target_attachments[node] = length
+
+        distance = {}
+        came_from = {}  # node -> (previous node, edge number) or None for a start node
+        heap = []
+        for node, length in self.attachments(source):
+            if node not in distance or length < distance[node]:
+                distance[node] = length
+                came_from[node] = None
+                heapq.heappush(heap, (length, node))
+
+        while heap:
+            length, node = heapq.heappop(heap)
+            if length > distance[node]:
+                continue  # old heap entry
+            if best_length != -1 and length >= best_length:
+                break  # every remaining way is already longer than the best one found
+            if node in target_attachments:
+                total = length + target_attachments[node]
+                if best_length == -1 or total < best_length:
+                    best_length, best_end = total, node
+            for other, weight, edge in self.adjacent[node]:
+                if other not in distance or length + weight < distance[other]:
+                    distance[other] = length + weight
+                    came_from[other] = (node, edge)
+                    heapq.heappush(heap, (length + weight, other))
+
+        if best_length == -1:
+            return []
+        return self.expand_corridor_path(source, target, best_end, came_from)
+
+    def expand_corridor_path(self, source: int, target: int, end_node, came_from: dict) -> list[tuple[int, int]]:
+        # turns the node sequence back into the full list of cells
+        grid = self.grid
+        if end_node is None:
+            # straight along the common corridor
+            corridor = self.edges[self.edge_of[source]][2]
+            first, last = self.position[source], self.position[target]
+            step = 1 if last >= first else -1
+            return [grid.location_of(corridor[i]) for i in range(first, last + step, step)]
+
+        # the nodes from the end back to the first node
+        cells = []
+        node = end_node
+        while came_from[node] is not None:
+            previous, edge = came_from[node]
+            a, b, corridor = self.edges[edge]
+            # the edge's cells from 'node' back towards 'previous' (without 'previous' itself)
+            cells.append(self.node_cells[node])
+            cells.extend(reversed(corridor) if node == b else corridor)
+            node = previous
+        cells.append(self.node_cells[node])
+        cells.reverse()  # now: first node ... end_node
+
+        # from the start cell to the first node, along the start's corridor
+        start_part = self.corridor_piece(source, cells[0])
+        # from end_node to the end cell, along the end's corridor
+        end_part = self.corridor_piece(target, cells[-1])
+        end_part.reverse()
+        return [grid.location_of(cell) for cell in start_part + cells[1:-1] + end_part] \
+            if len(cells) > 1 else [grid.location_of(cell) for cell in start_part + end_part[1:]]
+
+    def corridor_piece(self, cell: int, node_cell: int) -> list[int]:
+        # the cells from 'cell' to the neighbouring node 'node_cell' (both included), along cell's corridor
+        if cell == node_cell:
+            return [cell]
+        a, b, corridor = self.edges[self.edge_of[cell]]
+        position = self.position[cell]
+        if self.node_cells[a] == node_cell and (self.node_cells[b] != node_cell or position + 1 <= len(corridor) - position):
+            return list(reversed(corridor[:position + 1])) + [node_cell]
+        return list(corridor[position:]) + [node_cell]
+
+
+### BATCH: answering many (start, end) questions on the same labyrinth
+# - the labyrinth is compiled only once
+# - questions with the same start are grouped: ONE complete BFS tree (bfs_tree) answers all of them
+# - the groups are spread over several processes; the compiled cells are put into shared memory once,
+#   every process only gets its name (no pickled copy of the labyrinth per process or per task)
+# - results are given back (yield) as soon as a group is finished, not all at the end
+
+# FUNCTION that reads the questions from a file: one question per line, "start_row start_column end_row end_column"
+# (any separators are fine, e.g. "1 1 5 11" or "(1, 1) (5, 11)"); empty lines and lines starting with # are skipped
+def read_queries(filename: str):
+    with open(filename, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            numbers = [int(number) for number in re.findall(r"-?\d+", line)]
+            if len(numbers) != 4:
+                raise ValueError(f"{filename}, line {line_number}: expected 4 numbers, got {line!r}")
+            yield (numbers[0], numbers[1]), (numbers[2], numbers[3])
+
+
+# FUNCTION that groups the questions by their start: {start: [end, end, ...]} (order of the file is kept)
+def group_by_start(queries) -> dict:
+    groups = {}
+    for start, end in queries:
+        groups.setdefault(start, []).append(end)
+    return groups
+
+
+# FUNCTION that answers all questions of one start: a normal bfs for a single end, one BFS tree for several ends
+def answer_group(grid: CompiledLabyrinth, start: tuple[int, int], ends: list) -> list:
+    if len(ends) == 1 or not grid.contains(start):
+        return [(start, end, grid.bfs(start, end)) for end in ends]
+    source = grid.index_of(start)
+    _, parent = grid.bfs_tree(source)
+    answers = []
+    for end in ends:
+        if end == start:
+            path = [start]
+        elif not grid.contains(end) or parent[grid.index_of(end)] == -1:
+            path = []  # not reachable (or outside / a wall)
+        else:
+            path = grid.reconstruct_path(parent, source, grid.index_of(end))
+        answers.append((start, end, path))
+    return answers
+
+
+# every worker process keeps its view of the shared labyrinth here (set once by attach_shared_grid)
+worker_memory = None
+worker_grid = None
+
+
+def attach_shared_grid(name: str, rows: int, columns: int):
+    global worker_memory, worker_grid
+    worker_memory = shared_memory.SharedMemory(name=name)
+    worker_grid = CompiledLabyrinth.from_cells(rows, columns, worker_memory.buf)
+
+
+def answer_groups_in_worker(groups: list) -> list:
+    answers = []
+    for start, ends in groups:
+        answers.extend(answer_group(worker_grid, start, ends))
+    return answers
+
+
+# FUNCTION that answers all questions and yields (start, end, path) as soon as they are finished
+# workers = number of processes (None = one per CPU, 0 = everything in this process)
+# group_size = about how many questions are sent to a process at once (fewer, bigger messages)
+def batch_paths(lab: list[str], queries, workers: int = None, group_size: int = 64):
+    grid = lab if isinstance(lab, CompiledLabyrinth) else CompiledLabyrinth(lab)
+    groups = group_by_start(queries)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(groups) <= 1:
+        for start, ends in groups.items():
+            yield from answer_group(grid, start, ends)
+        return
+
+    # pack small groups together into tasks of about 'group_size' questions
+    tasks = [[]]
+    size = 0
+    for start, ends in groups.items():
+        if size >= group_size:
+            tasks.append([])
+            size = 0
+        tasks[-1].append((start, ends))
+        size += len(ends)
+
+    memory = shared_memory.SharedMemory(create=True, size=max(len(grid.cells), 1))
+    try:
+        memory.buf[:len(grid.cells)] = grid.cells
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_shared_grid,
+                                 initargs=(memory.name, grid.rows, grid.columns)) as pool:
+            futures = [pool.submit(answer_groups_in_worker, task) for task in tasks]
+            for future in as_completed(futures):
+                yield from future.result()
+    finally:
+        memory.close()
+        memory.unlink()
+
+
 # HARD-CODED PATH
     #path = [(1, 4), (1, 5), (1, 6), (1, 7), (2, 7), (3, 7), (4, 7), (5, 7), (5, 8), (5, 9), (5, 10)]
     #return path
@@ -154,15 +809,24 @@ labyrinth = [
     "█████████████"
 ]
 
-# prints the initial state of labyrinth
-print_labyrinth(labyrinth)
+# the program itself only runs when the file is started (not when it is imported, e.g. by the worker processes)
+if __name__ == "__main__":
+    # "python Exercise_2.py batch queries.txt [workers]" answers a whole file of questions
+    if len(sys.argv) >= 3 and sys.argv[1] == "batch":
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        for start, end, path in batch_paths(labyrinth, read_queries(sys.argv[2]), workers):
+            print(start, end, len(path) - 1 if path else "no path", flush=True)
+        sys.exit()
+
+    # prints the initial state of labyrinth
+    print_labyrinth(labyrinth)
 
-# Prompts the user for start and end locations.
-start_location = prompt_user_for_location("start")
-end_location = prompt_user_for_location("end")
+    # Prompts the user for start and end locations.
+    start_location = prompt_user_for_location("start")
+    end_location = prompt_user_for_location("end")
 
-# Find path using breadth-first search between start and end locations
-path = bfs(labyrinth, start_location, end_location)
+    # Find path using breadth-first search between start and end locations
+    path = bfs(labyrinth, start_location, end_location)
 
-# using the function print_labyrinth to print the labyrinth and the found path in it marked with 'X's
-print_labyrinth(labyrinth, path)
\ No newline at end of file
+    # using the function print_labyrinth to print the labyrinth and the found path in it marked with 'X's
+    print_labyrinth(labyrinth, path)
\ No newline at end of file
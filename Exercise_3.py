@@ -1,47 +1,235 @@
+import heapq
 import math
+import sys
+import time
+from array import array
+from collections.abc import MutableSequence
+from io import StringIO
 
 # ''' FIRST TASK '''
-class Canvas(list):
+def visible_steps(origin: int, sign: int, size: int, other_origin: int, other_sign: int, other_size: int,
+                  long: int, short: int) -> tuple[int, int]:
+    # the range of Bresenham steps k (0..long) whose pixel lies on the canvas; 'origin' is the coordinate along
+    # the longer axis (it moves every step), 'other_origin' the one along the shorter axis (moved ceil(...) steps)
+    def offsets_inside(start: int, direction: int, limit: int) -> tuple[int, int]:
+        # how far one may move from start in direction and still be inside 0..limit-1
+        return (-start, limit - 1 - start) if direction > 0 else (start - limit + 1, start)
+
+    low, high = offsets_inside(origin, sign, size)
+    first, last = max(low, 0), min(high, long)
+    low, high = offsets_inside(other_origin, other_sign, other_size)
+    if short == 0:
+        return (first, last) if low <= 0 <= high else (1, 0)
+    if low > 0:
+        # first k with ceil((2k * short - long) / (2 * long)) >= low
+        first = max(first, (2 * low - 1) * long // (2 * short) + 1)
+    if high < short:
+        # last k with ceil((2k * short - long) / (2 * long)) <= high
+        last = min(last, (2 * high + 1) * long // (2 * short))
+    return first, last
+
+
+class Canvas:
+    # the pixels live in one flat bytearray (row after row), one byte per pixel:
+    # ASCII characters are stored as themselves, other characters get a code from 128 on (see code_of)
     def __init__(self, width: int, height: int):
-        # calls the __init__ method of the parent list class -> inherits all list functionalities
-        super().__init__()
         self.width = width
         self.height = height
-        for _ in range(height):
-            self.append(" " * width)
-
-    def print(self):
+        self.pixels = bytearray(b" " * (width * height))
+        self.palette = {}  # non-ASCII character -> its code
+        self.characters = {}  # code -> non-ASCII character (translation table for rendering)
+        # dirty region: per row the leftmost and rightmost column changed since the last print (left > right = clean)
+        self.dirty_left = array("i", [0]) * height
+        self.dirty_right = array("i", [width - 1]) * height
+        self.shown = None  # the pixels as they were last printed (None = never printed)
+
+    def code_of(self, char: str) -> int:
+        if ord(char) < 128:
+            return ord(char)
+        if char not in self.palette:
+            if len(self.palette) == 128:
+                raise ValueError("a canvas can use at most 128 different non-ASCII characters")
+            self.palette[char] = 128 + len(self.palette)
+            self.characters[self.palette[char]] = char
+        return self.palette[char]
+
+    def decode(self, codes: bytes) -> str:
+        text = codes.decode("latin-1")
+        return text.translate(self.characters) if self.characters else text
+
+    def row(self, y: int) -> str:
+        return self.decode(self.pixels[y * self.width:(y + 1) * self.width])
+
+    # a Canvas still reads like the old list of row strings: canvas[y], len(canvas), for row in canvas
+    def __getitem__(self, y: int) -> str:
+        if not -self.height <= y < self.height:
+            raise IndexError("canvas row out of range")
+        return self.row(y % self.height)
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self):
+        return (self.row(y) for y in range(self.height))
+
+    def render(self) -> str:
         def create_row_headers(length: int):
             return "".join([str(i % 10) for i in range(length)])
-        header = " " + create_row_headers(self.width)
-        print(header)
-        for idx, row in enumerate(self):
-            print(idx % 10, row, idx % 10, sep="")  # sep="" no space between
-        print(header)
-
-    def replace_at_index(self, s: str, r: str, idx: int) -> str:
-        return s[:idx] + r + s[idx + len(r):]
-
-    def draw_line_segment(self, start: tuple[int, int], end: tuple[int, int], line_char: str = "*"):
+        header = " " + create_row_headers(self.width) + "\n"
+        rows = [f"{idx % 10}{row}{idx % 10}\n" for idx, row in enumerate(self)]
+        return header + "".join(rows) + header
+
+    def render_changes(self) -> str:
+        # ANSI escape codes that update only the changed characters of the frame printed before
+        # (the cursor is expected right below that frame, where the last print left it)
+        parts = []
+        for y in range(self.height):
+            left, right = self.dirty_left[y], self.dirty_right[y]
+            if left > right:
+                continue
+            start = y * self.width
+            new = self.pixels[start + left:start + right + 1]
+            old = self.shown[start + left:start + right + 1]
+            if new == old:
+                continue
+            # the dirty region can be bigger than the real change: compare with the previous frame
+            first = 0
+            while new[first] == old[first]:
+                first += 1
+            last = len(new) - 1
+            while new[last] == old[last]:
+                last -= 1
+            up = self.height + 1 - y  # lines between the cursor and this row (the footer is the last line)
+            # up, to the column (1-based, after the row number), write, back down to the start of the line
+            parts.append(f"\x1b[{up}A\x1b[{left + first + 2}G{self.decode(new[first:last + 1])}\x1b[{up}B\r")
+        return "".join(parts)
+
+    def mark_dirty(self, x1: int, y1: int, x2: int, y2: int):
+        # grows the dirty region of the rows y1..y2 by the columns x1..x2 (already clipped to the canvas)
+        for y in range(y1, y2 + 1):
+            if x1 < self.dirty_left[y]:
+                self.dirty_left[y] = x1
+            if x2 > self.dirty_right[y]:
+                self.dirty_right[y] = x2
+
+    def print(self, incremental: bool = False, file=None):
+        # incremental=True: after the first frame only the changed parts are written (ANSI cursor movement)
+        file = file or sys.stdout
+        if incremental and self.shown is not None:
+            file.write(self.render_changes())
+        else:
+            file.write(self.render())
+        file.flush()
+        self.shown = bytearray(self.pixels)
+        self.dirty_left = array("i", [self.width]) * self.height
+        self.dirty_right = array("i", [-1]) * self.height
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    # everything is clipped to the canvas: parts outside of it are simply not drawn
+    def draw_horizontal_span(self, x1: int, x2: int, y: int, code: int):
+        # one slice assignment writes the whole span
+        if x1 > x2:
+            x1, x2 = x2, x1
+        x1, x2 = max(x1, 0), min(x2, self.width - 1)
+        if x1 > x2 or not 0 <= y < self.height:
+            return
+        start = y * self.width
+        self.pixels[start + x1:start + x2 + 1] = bytes((code,)) * (x2 - x1 + 1)
+        self.mark_dirty(x1, y, x2, y)
+
+    def draw_vertical_span(self, x: int, y1: int, y2: int, code: int):
+        # an extended slice (step = width) hits one pixel per row
+        if y1 > y2:
+            y1, y2 = y2, y1
+        y1, y2 = max(y1, 0), min(y2, self.height - 1)
+        if y1 > y2 or not 0 <= x < self.width:
+            return
+        self.pixels[y1 * self.width + x:y2 * self.width + x + 1:self.width] = bytes((code,)) * (y2 - y1 + 1)
+        self.mark_dirty(x, y1, x, y2)
+
+    def draw_line_segments(self, segments, line_char: str = "*"):
+        # rasterizes many segments in one call: the character code, the buffer and the width are looked up once
+        code = self.code_of(line_char)
+        pixels = self.pixels
+        width = self.width
+        for start, end in segments:
+            x1, y1 = start
+            x2, y2 = end
+            if y1 == y2:
+                self.draw_horizontal_span(x1, x2, y1, code)
+                continue
+            if x1 == x2:
+                self.draw_vertical_span(x1, y1, y2, code)
+                continue
+            if not (self.contains(x1, y1) and self.contains(x2, y2)):
+                self.draw_clipped_segment(start, end, code)
+                continue
+            dx = abs(x2 - x1)  # horizontal distance between start and end points
+            dy = abs(y2 - y1)  # vertical distance between start and end points
+            sx = 1 if x1 < x2 else -1  # determines direction of movement along x and y axes
+            sy = width if y1 < y2 else -width  # one row down/up = one width further in the buffer
+            error = dx - dy
+            index = y1 * width + x1
+            target = y2 * width + x2
+            # Bresenham's Line Algorithm Loop, moving an index through the flat buffer
+            while index != target:
+                pixels[index] = code
+                double_error = error * 2
+                if double_error > -dy:
+                    error -= dy
+                    index += sx
+                if double_error < dx:
+                    error += dx
+                    index += sy
+            pixels[target] = code
+            self.mark_dirty(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    def draw_clipped_segment(self, start: tuple[int, int], end: tuple[int, int], code: int):
+        # the same Bresenham steps, but the walk starts where the line enters the canvas and stops where it leaves it
+        # (Liang-Barsky on the step number): after k steps along the longer axis the shorter axis has moved
+        # ceil((2 * k * short - long) / (2 * long)) steps, so the first and last visible step follow with integers only
         x1, y1 = start
         x2, y2 = end
-        dx = abs(x2 - x1)  # horizontal distance between start and end points
-        dy = abs(y2 - y1)  # vertical distance between start and end points
-        sx = 1 if x1 < x2 else -1  # determines direction of movement along x and y axes
+        width, height = self.width, self.height
+        dx = abs(x2 - x1)
+        dy = abs(y2 - y1)
+        sx = 1 if x1 < x2 else -1
         sy = 1 if y1 < y2 else -1
-        error = dx - dy
-        # Bresenham's Line Algorithm Loop
-        while x1 != x2 or y1 != y2:
-            self[y1] = self.replace_at_index(self[y1], line_char, x1)
-            # checks if current error value is enough to trigger a step in either the x or y direction
+        if dx >= dy:
+            first, last = visible_steps(x1, sx, width, y1, sy, height, dx, dy)
+        else:
+            first, last = visible_steps(y1, sy, height, x1, sx, width, dy, dx)
+        if first > last:
+            return  # the line misses the canvas
+        # the Bresenham state after 'first' steps: every x step subtracts dy from the error, every y step adds dx
+        if first == 0:
+            x_steps = y_steps = 0
+        elif dx >= dy:
+            x_steps, y_steps = first, (2 * first * dy + dx - 1) // (2 * dx)
+        else:
+            x_steps, y_steps = (2 * first * dx + dy - 1) // (2 * dy), first
+        error = dx - dy - x_steps * dy + y_steps * dx
+        x, y = x1 + sx * x_steps, y1 + sy * y_steps
+        index = y * width + x
+        step_y = width * sy
+        pixels = self.pixels
+        for _ in range(last - first):
+            pixels[index] = code
             double_error = error * 2
             if double_error > -dy:
                 error -= dy
-                x1 += sx
+                index += sx
             if double_error < dx:
                 error += dx
-                y1 += sy
-        self[y2] = self.replace_at_index(self[y2], line_char, x2)
+                index += step_y
+        pixels[index] = code
+        end_y, end_x = divmod(index, width)
+        self.mark_dirty(min(x, end_x), min(y, end_y), max(x, end_x), max(y, end_y))
+
+    def draw_line_segment(self, start: tuple[int, int], end: tuple[int, int], line_char: str = "*"):
+        self.draw_line_segments([(start, end)], line_char)
 
     def draw_polygon(self, *points: tuple[int, int], closed: bool = True, line_char: str = "*"):
         start_points = points[:-1]
@@ -49,8 +237,7 @@ class Canvas(list):
         if closed:
             start_points += (points[-1],) # notation with comma at the end -> indicates a tuple
             end_points += (points[0],)
-        for start_point, end_point in zip(start_points, end_points):
-            self.draw_line_segment(start_point, end_point, line_char)
+        self.draw_line_segments(zip(start_points, end_points), line_char)
 
     def draw_line(self, start: tuple[int, int], end: tuple[int, int], line_char: str = "*"):
         self.draw_line_segment(start, end, line_char)
@@ -60,9 +247,67 @@ class Canvas(list):
         x2, y2 = lower_right
         self.draw_polygon(upper_left, (x2, y1), lower_right, (x1, y2), line_char=line_char)
 
-    def draw_n_gon(self, center: tuple[int, int], radius: int, number_of_points: int,
-                   rotation: int = 0,
-                   line_char: str = "*"):
+    def fill_rectangle(self, upper_left: tuple[int, int], lower_right: tuple[int, int], fill_char: str = "*"):
+        code = self.code_of(fill_char)
+        x1, y1 = upper_left
+        x2, y2 = lower_right
+        for y in range(max(min(y1, y2), 0), min(max(y1, y2), self.height - 1) + 1):
+            self.draw_horizontal_span(x1, x2, y, code)
+
+    def fill_polygon(self, *points: tuple[int, int], fill_char: str = "*"):
+        # scanline fill with an active edge table (even-odd rule), one span write per pair of crossings,
+        # then the outline, so the filled shape covers exactly the pixels of draw_polygon and its inside
+        code = self.code_of(fill_char)
+        # edge table: every non-horizontal edge as (y_min, y_max, x at y_min, dx, dy), sorted by y_min
+        edges = []
+        for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+            if y1 == y2:
+                continue
+            if y1 > y2:
+                x1, y1, x2, y2 = x2, y2, x1, y1
+            edges.append((y1, y2, x1, x2 - x1, y2 - y1))
+        edges.sort()
+
+        active = []
+        next_edge = 0
+        first_row = max(edges[0][0], 0) if edges else 0
+        last_row = min(max((edge[1] for edge in edges), default=-1), self.height - 1)
+        for y in range(first_row, last_row + 1):
+            # edges start at their y_min and end before their y_max (a shared corner is only counted once)
+            while next_edge < len(edges) and edges[next_edge][0] <= y:
+                active.append(edges[next_edge])
+                next_edge += 1
+            active = [edge for edge in active if edge[1] > y]
+
+            # crossing of each active edge with this row as an exact fraction numerator / dy
+            crossings = [(x_start * dy + (y - y_start) * dx, dy) for y_start, _, x_start, dx, dy in active]
+            crossings.sort(key=lambda crossing: crossing[0] / crossing[1])
+            for (left, left_dy), (right, right_dy) in zip(crossings[::2], crossings[1::2]):
+                # pixels whose x lies between the two crossings: ceil(left) .. floor(right)
+                first, last = -(-left // left_dy), right // right_dy
+                if first <= last:
+                    self.draw_horizontal_span(first, last, y, code)
+
+        self.draw_polygon(*points, line_char=fill_char)
+
+    def draw_shape(self, shape, line_char: str = "*"):
+        points = [(round(x), round(y)) for x, y in zip(shape.xs, shape.ys)]
+        if points:
+            self.draw_polygon(*points, line_char=line_char)
+
+    def draw_shapes(self, shapes, line_char: str = "*"):
+        # with a ShapeIndex only the shapes that intersect the canvas are looked at at all
+        if isinstance(shapes, ShapeIndex):
+            shapes = shapes.intersecting(-0.5, -0.5, self.width - 0.5, self.height - 0.5)
+        for shape in shapes:
+            self.draw_shape(shape, line_char)
+
+    def clear(self, char: str = " "):
+        self.pixels[:] = bytes((self.code_of(char),)) * len(self.pixels)
+        self.mark_dirty(0, 0, self.width - 1, self.height - 1)
+
+    def n_gon_points(self, center: tuple[int, int], radius: int, number_of_points: int,
+                     rotation: int = 0) -> list[tuple[int, int]]:
         angles = range(rotation, 360 + rotation, 360 // number_of_points)
 
         points = []
@@ -74,8 +319,39 @@ class Canvas(list):
             y = center[1] + radius * math.sin(angle_in_radians)
             # Add the point to the list of points as a tuple
             points.append((round(x), round(y)))
+        return points
 
-        self.draw_polygon(*points, line_char=line_char)
+    def draw_n_gon(self, center: tuple[int, int], radius: int, number_of_points: int,
+                   rotation: int = 0,
+                   line_char: str = "*"):
+        self.draw_polygon(*self.n_gon_points(center, radius, number_of_points, rotation), line_char=line_char)
+
+    def fill_n_gon(self, center: tuple[int, int], radius: int, number_of_points: int,
+                   rotation: int = 0,
+                   fill_char: str = "*"):
+        self.fill_polygon(*self.n_gon_points(center, radius, number_of_points, rotation), fill_char=fill_char)
+
+
+def benchmark_frame_rate(frames: int = 200, width: int = 100, height: int = 40) -> dict:
+    # an n-gon turning on a canvas, printed every frame in full and incrementally (into memory, not to the terminal)
+    results = {}
+    for incremental in (False, True):
+        canvas = Canvas(width, height)
+        output = StringIO()
+        started = time.perf_counter()
+        previous = None
+        for frame in range(frames):
+            if previous:
+                canvas.draw_polygon(*previous, line_char=" ")  # erase the last position
+            previous = canvas.n_gon_points((width // 2, height // 2), min(width, height) // 2 - 2, 6, frame * 3)
+            canvas.draw_polygon(*previous, line_char="*")
+            canvas.print(incremental=incremental, file=output)
+        seconds = time.perf_counter() - started
+        results["incremental" if incremental else "full"] = {
+            "frames per second": frames / seconds,
+            "characters per frame": len(output.getvalue()) / frames,
+        }
+    return results
 
 
 # Example usage
@@ -90,6 +366,9 @@ my_canvas.print()
 
 # ''' SECOND TASK '''
 class Point:
+    # no per-instance __dict__: a Point is just its two coordinates
+    __slots__ = ("x", "y")
+
     def __init__(self, x: float, y: float):
         self.x = x
         self.y = y
@@ -110,32 +389,127 @@ p5 = Point(5, 5)
 p6 = Point(10,10)
 
 
+def coordinate(value: float):
+    # coordinates are stored as floats; whole numbers come back as int, so (0/1) doesn't turn into (0.0/1.0)
+    return int(value) if value.is_integer() else value
+
+
+class PointList(MutableSequence):
+    # list-like view of a shape's points: shape.points[i], .append(p), del shape.points[i], ... all change the
+    # coordinate arrays of the shape (and clear its cached centroid)
+    __slots__ = ("shape",)
+
+    def __init__(self, shape):
+        self.shape = shape
+
+    def __len__(self) -> int:
+        return len(self.shape.xs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Point(coordinate(self.shape.xs[index]), coordinate(self.shape.ys[index]))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            points = list(value)
+            self.shape.xs[index] = array("d", [point.x for point in points])
+            self.shape.ys[index] = array("d", [point.y for point in points])
+        else:
+            self.shape.xs[index] = value.x
+            self.shape.ys[index] = value.y
+        self.shape.invalidate()
+
+    def __delitem__(self, index):
+        del self.shape.xs[index]
+        del self.shape.ys[index]
+        self.shape.invalidate()
+
+    def insert(self, index: int, point):
+        self.shape.xs.insert(index, point.x)
+        self.shape.ys.insert(index, point.y)
+        self.shape.invalidate()
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class Shape(list):
+    # the coordinates are stored column by column in two float arrays (xs, ys) instead of a list of Point objects;
+    # centroid and distance are computed once and cached until the shape changes (points, add_point, remove_point, move)
+    __slots__ = ("xs", "ys", "cached_centroid", "cached_distance")
+
     # *points --> allows Shape to accept any numbers of Point objects
     def __init__(self, *points):
         super().__init__()
-        self.points = list(points)
+        self.xs = array("d", [point.x for point in points])
+        self.ys = array("d", [point.y for point in points])
+        self.invalidate()
+
+    @classmethod
+    def from_coordinates(cls, xs, ys) -> "Shape":
+        shape = cls()
+        shape.xs = array("d", xs)
+        shape.ys = array("d", ys)
+        if len(shape.xs) != len(shape.ys):
+            raise ValueError("xs and ys must have the same length")
+        return shape
+
+    @property
+    def points(self) -> PointList:
+        return PointList(self)
+
+    @points.setter
+    def points(self, points):
+        points = list(points)
+        self.xs = array("d", [point.x for point in points])
+        self.ys = array("d", [point.y for point in points])
+        self.invalidate()
+
+    def invalidate(self):
+        self.cached_centroid = None
+        self.cached_distance = None
+
+    def add_point(self, point: Point):
+        self.xs.append(point.x)
+        self.ys.append(point.y)
+        self.invalidate()
+
+    def remove_point(self, index: int) -> Point:
+        point = Point(coordinate(self.xs.pop(index)), coordinate(self.ys.pop(index)))
+        self.invalidate()
+        return point
+
+    def bounding_box(self) -> tuple[float, float, float, float]:
+        # (min x, min y, max x, max y) of all points
+        return min(self.xs), min(self.ys), max(self.xs), max(self.ys)
+
+    def move(self, dx: float, dy: float):
+        self.xs = array("d", [x + dx for x in self.xs])
+        self.ys = array("d", [y + dy for y in self.ys])
+        self.invalidate()
 
     def __str__(self):
         points_str = ", ".join(str(point) for point in self.points)
         return f"Shape [{points_str}]"
 
     def centroid(self) -> Point:
-        # number of points in Shape = length of the list with the points
-        n = len(self.points)
+        # number of points in Shape = length of the coordinate arrays
+        n = len(self.xs)
         # no points means no centroid
         if n == 0:
             return None
-
-        sum_x = sum(point.x for point in self.points)
-        sum_y = sum(point.y for point in self.points)
-
-        return Point(sum_x / n, sum_y / n)
+        if self.cached_centroid is None:
+            # sum() runs over the arrays in C, no attribute lookups per point
+            self.cached_centroid = (sum(self.xs) / n, sum(self.ys) / n)
+        return Point(*self.cached_centroid)
 
     def distance_from_origin(self):
         # same as in Point class but with centroid point
-        centroid = self.centroid()
-        return math.sqrt(centroid.x ** 2 + centroid.y ** 2)
+        if self.cached_distance is None:
+            centroid = self.centroid()
+            self.cached_distance = math.sqrt(centroid.x ** 2 + centroid.y ** 2)
+        return self.cached_distance
 
     def __eq__(self, other):
         return self.distance_from_origin() == other.distance_from_origin()
@@ -147,6 +521,205 @@ class Shape(list):
         points_str = ', '.join(str(point) for point in self.points)
         return f"Shape [{points_str}]"
 
+
+# bulk versions for whole collections of shapes (each shape's cache is filled and reused)
+def centroids(shapes) -> tuple[array, array]:
+    xs = array("d")
+    ys = array("d")
+    for shape in shapes:
+        centroid = shape.centroid()
+        xs.append(centroid.x)
+        ys.append(centroid.y)
+    return xs, ys
+
+
+def distances_from_origin(shapes) -> array:
+    return array("d", map(Shape.distance_from_origin, shapes))
+
+
+def sort_by_distance(shapes) -> list:
+    # every distance is computed once up front, the sort itself only compares floats
+    shapes = list(shapes)
+    distances = distances_from_origin(shapes)
+    order = sorted(range(len(distances)), key=distances.__getitem__)
+    return [shapes[i] for i in order]
+
+
+class KDNode:
+    __slots__ = ("shape", "x", "y", "axis", "left", "right", "bounds")
+
+    def __init__(self, shape: Shape, x: float, y: float, axis: int):
+        self.shape = shape
+        self.x, self.y = x, y  # centroid of the shape
+        self.axis = axis  # 0 = split by x, 1 = split by y
+        self.left = self.right = None
+        # bounding box of all shapes in this subtree -> whole subtrees can be skipped by intersecting()
+        self.bounds = list(shape.bounding_box())
+
+
+class ShapeIndex:
+    # a k-d tree over the centroids of shapes: nearest, radius and box queries only visit the parts of the
+    # tree that can contain an answer (about log n nodes for a balanced tree instead of all shapes)
+    # shapes must not change while they are in the index: remove them, change them, insert them again
+    def __init__(self, shapes=()):
+        self.removed = set()  # id() of removed shapes, they are dropped for good at the next rebuild
+        self.size = 0
+        self.root = None
+        self.rebuild([shape for shape in shapes])
+
+    def rebuild(self, shapes: list[Shape]):
+        def build(entries: list, depth: int):
+            if not entries:
+                return None
+            axis = depth % 2
+            entries.sort(key=lambda entry: entry[1 + axis])
+            middle = len(entries) // 2
+            shape, x, y = entries[middle]
+            node = KDNode(shape, x, y, axis)
+            node.left = build(entries[:middle], depth + 1)
+            node.right = build(entries[middle + 1:], depth + 1)
+            for child in (node.left, node.right):
+                if child:
+                    self.grow(node.bounds, child.bounds)
+            return node
+
+        entries = []
+        for shape in shapes:
+            centroid = shape.centroid()
+            if centroid is None:
+                raise ValueError("an empty shape has no position and can't be indexed")
+            entries.append((shape, centroid.x, centroid.y))
+        self.removed.clear()
+        self.size = len(entries)
+        self.root = build(entries, 0)
+
+    @staticmethod
+    def grow(bounds: list, other):
+        bounds[0] = min(bounds[0], other[0])
+        bounds[1] = min(bounds[1], other[1])
+        bounds[2] = max(bounds[2], other[2])
+        bounds[3] = max(bounds[3], other[3])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            if id(node.shape) not in self.removed:
+                yield node.shape
+            stack.extend(child for child in (node.left, node.right) if child)
+
+    def insert(self, shape: Shape):
+        centroid = shape.centroid()
+        if centroid is None:
+            raise ValueError("an empty shape has no position and can't be indexed")
+        if id(shape) in self.removed:
+            self.rebuild(list(self))  # drop the dead node of this very shape first
+        self.size += 1
+        if self.root is None:
+            self.root = KDNode(shape, centroid.x, centroid.y, 0)
+            return
+        # walk down like a search and hang the new node where the walk ends
+        bounds = shape.bounding_box()
+        node = self.root
+        while True:
+            self.grow(node.bounds, bounds)
+            key, split = (centroid.x, node.x) if node.axis == 0 else (centroid.y, node.y)
+            side = "left" if key < split else "right"
+            child = getattr(node, side)
+            if child is None:
+                setattr(node, side, KDNode(shape, centroid.x, centroid.y, 1 - node.axis))
+                return
+            node = child
+
+    def remove(self, shape: Shape):
+        if id(shape) in self.removed or not any(indexed is shape for indexed in self.within_radius(
+                (shape.centroid().x, shape.centroid().y), 0)):
+            raise KeyError("shape is not in the index")
+        self.removed.add(id(shape))
+        self.size -= 1
+        # once more than half of the nodes are dead, a rebuild is cheaper than skipping them
+        if len(self.removed) > self.size:
+            self.rebuild(list(self))
+
+    def nearest(self, point: tuple[float, float] = (0, 0), k: int = 1) -> list[Shape]:
+        # the k shapes whose centroids are closest to point (default: the origin), closest first
+        px, py = point
+        heap = []  # max-heap of the k best so far: (-squared distance, tie breaker, shape)
+        # stack of (node, squared distance from point to the region of that subtree, at least)
+        stack = [(self.root, 0.0)] if self.root and k > 0 else []
+        while stack:
+            node, bound = stack.pop()
+            # the subtree can only help if its region is closer than the k-th best distance
+            if len(heap) == k and bound > -heap[0][0]:
+                continue
+            dx, dy = px - node.x, py - node.y
+            if id(node.shape) not in self.removed:
+                entry = (-(dx * dx + dy * dy), -id(node.shape), node.shape)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            difference = dx if node.axis == 0 else dy
+            near, far = (node.right, node.left) if difference >= 0 else (node.left, node.right)
+            # the near side is pushed last, so it is searched first
+            if far:
+                stack.append((far, max(bound, difference * difference)))
+            if near:
+                stack.append((near, bound))
+        return [shape for _, _, shape in sorted(heap, reverse=True)]
+
+    def within_radius(self, point: tuple[float, float], radius: float) -> list[Shape]:
+        px, py = point
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            dx, dy = px - node.x, py - node.y
+            if dx * dx + dy * dy <= radius * radius and id(node.shape) not in self.removed:
+                found.append(node.shape)
+            difference = dx if node.axis == 0 else dy
+            # left subtree: centroids <= the split, right subtree: centroids >= the split
+            if node.left and difference - radius <= 0:
+                stack.append(node.left)
+            if node.right and difference + radius >= 0:
+                stack.append(node.right)
+        return found
+
+    def in_box(self, x1: float, y1: float, x2: float, y2: float) -> list[Shape]:
+        # shapes whose centroid lies in the box
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            if x1 <= node.x <= x2 and y1 <= node.y <= y2 and id(node.shape) not in self.removed:
+                found.append(node.shape)
+            low, high, split = (x1, x2, node.x) if node.axis == 0 else (y1, y2, node.y)
+            if node.left and low <= split:
+                stack.append(node.left)
+            if node.right and high >= split:
+                stack.append(node.right)
+        return found
+
+    def intersecting(self, x1: float, y1: float, x2: float, y2: float) -> list[Shape]:
+        # shapes whose bounding box overlaps the box (e.g. the viewport of a Canvas)
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            min_x, min_y, max_x, max_y = node.bounds
+            if max_x < x1 or min_x > x2 or max_y < y1 or min_y > y2:
+                continue  # nothing in this subtree reaches the box
+            if id(node.shape) not in self.removed:
+                bx1, by1, bx2, by2 = node.shape.bounding_box()
+                if not (bx2 < x1 or bx1 > x2 or by2 < y1 or by1 > y2):
+                    found.append(node.shape)
+            stack.extend(child for child in (node.left, node.right) if child)
+        return found
+
+
 # Example usage change coordinates
 p1 = Point(4.3, 34.12)  # Create a Point object at ()
 p2 = Point(6.23, 1.2)   # Create a Point object at ()
@@ -1,6 +1,24 @@
+import atexit
+import glob
 import logging
+import math
+import mmap
+import os
+import queue
+import re
 import string
-from collections import Counter
+import sys
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+
+# how many characters the streaming analysis reads at once
+CHUNK_SIZE = 1 << 20
+# a piece without whitespace that gets longer than this is counted as one word fragment instead of being carried on
+MAX_CARRY = CHUNK_SIZE
+# how many bytes of a corpus one worker process counts per task (big files are split, small ones grouped)
+CORPUS_TASK_SIZE = 8 << 20
 
 lyrics = """\
 … So, so you think you can tell heaven from hell?
@@ -21,16 +39,31 @@ Running over the same old ground, what have we found?
 The same old fears, wish you were here\
 """
 
-def configure_logging():
+def configure_logging(console=True):
     # Configure logging
     # = way to track events that happen when some software runs, recording data about execution of program
-    # basicConfig - ensures all logs are directed to both the console and the execution_log.txt file
+    # all logs go to the execution_log.txt file and (if console is True) to the console
     # utf-8 = Unicode Transformation Format-8-bit, character encoding system, represents text in computers etc.
-    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[
-        logging.FileHandler("execution_log.txt", mode='w', encoding='utf-8'),
-        # writes log messages to file "execution_log.txt"
-        logging.StreamHandler()  # writes log messages to console
-    ])
+    # logging.info only puts the message into a queue (QueueHandler); a background thread (QueueListener)
+    # does the actual writing, so the analysis never waits for the disk or the terminal
+    if logging.getLogger().handlers:
+        return None  # already configured
+    handlers = [logging.FileHandler("execution_log.txt", mode='w', encoding='utf-8')]  # writes log messages to file
+    if console:
+        handlers.append(logging.StreamHandler())  # writes log messages to console
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)  # writes everything still in the queue before the program ends
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(log_queue)])
+    return listener
+
+
+def log_section(lines):
+    # A whole report section as ONE log message (one bulk write) instead of one message per line
+    logging.info("\n".join(lines))
 
 
 def save_lyrics_to_file(filename: str, lyrics: str):
@@ -56,17 +89,20 @@ def analyze_letter_frequency(content):
     non_alpha_char = [char for char in content_lower if not char.isalpha()]
     non_alpha_char_counts = Counter(non_alpha_char)
 
-    logging.info("\n===== Letter Frequency Results =====")
-    for letter, count in sorted(letter_counts.items()):
-        logging.info(f"{letter}: {count}")
-    logging.info(f"\n===== Non-alphabet characters =====")
-    logging.info(f"Total: {len(non_alpha_char)}")
-    for char, count in non_alpha_char_counts.items():
-        logging.info(f"{repr(char)}: {count}")
+    log_letter_frequency(letter_counts, non_alpha_char_counts)
 
     return letter_counts, unique_char_counts, Counter(content_lower)
 
 
+def log_letter_frequency(letter_counts: Counter, non_alpha_char_counts: Counter):
+    lines = ["\n===== Letter Frequency Results ====="]
+    lines += [f"{letter}: {count}" for letter, count in sorted(letter_counts.items())]
+    lines.append(f"\n===== Non-alphabet characters =====")
+    lines.append(f"Total: {sum(non_alpha_char_counts.values())}")
+    lines += [f"{repr(char)}: {count}" for char, count in non_alpha_char_counts.items()]
+    log_section(lines)
+
+
 def analyze_character_usage(char_counts: Counter):
     # Most and least frequently used characters
     top_5 = char_counts.most_common(5)
@@ -74,16 +110,15 @@ def analyze_character_usage(char_counts: Counter):
     unused_letters = [char for char in string.ascii_lowercase if char not in char_counts]
     # string.ascii_lowercase - built-in, contains string of all lowercase letters in English alphabet
 
-    logging.info("\n===== Top 5 Most Frequently Used Characters =====")
-    for char, count in top_5:
-        logging.info(f"{char}: {count}")
+    lines = ["\n===== Top 5 Most Frequently Used Characters ====="]
+    lines += [f"{char}: {count}" for char, count in top_5]
 
-    logging.info("\n===== Top 5 Least Frequently Used Characters =====")
-    for char, count in least_5:
-        logging.info(f"{char}: {count}")
+    lines.append("\n===== Top 5 Least Frequently Used Characters =====")
+    lines += [f"{char}: {count}" for char, count in least_5]
 
-    logging.info("\n===== Unused Alphabet Characters =====")
-    logging.info(", ".join(unused_letters))
+    lines.append("\n===== Unused Alphabet Characters =====")
+    lines.append(", ".join(unused_letters))
+    log_section(lines)
 
 
 def analyze_word_frequency(content):
@@ -94,49 +129,404 @@ def analyze_word_frequency(content):
     total_words = sum(word_counts.values())
     # analyzing WORD FREQUENCY: --> strip(string.punctuation) to exclude "..." (not a word)
 
-    logging.info("\n===== Word Frequency Results =====")
-    for word, count in word_counts.items():
-        logging.info(f"'{word}': {count}")
-    logging.info(f"\n===== Total unique words found in the lyrics: {len(word_counts)} =====")
+    log_word_frequency(word_counts)
 
     return word_counts, total_words
 
+
+def log_word_frequency(word_counts: Counter):
+    lines = ["\n===== Word Frequency Results ====="]
+    lines += [f"'{word}': {count}" for word, count in word_counts.items()]
+    lines.append(f"\n===== Total unique words found in the lyrics: {len(word_counts)} =====")
+    log_section(lines)
+
+
+def read_file_chunks(filename, chunk_size=CHUNK_SIZE):
+    # Read the file piece by piece (text mode takes care of UTF-8 characters split between two pieces)
+    with open(filename, 'r', encoding='utf-8') as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+# the last whitespace character: only non-whitespace follows it up to the very end
+LAST_WHITESPACE = re.compile(r"\s(?=\S*\Z)")
+
+
+def split_at_last_whitespace(text):
+    # everything up to the last whitespace can be counted now, the rest may be the beginning of a word
+    # that continues in the next chunk (cutting at whitespace also keeps .lower() exactly as for the whole text)
+    match = LAST_WHITESPACE.search(text)
+    if match is None:
+        return "", text
+    return text[:match.end()], text[match.end():]
+
+
+def count_text(text, char_counts: Counter, word_counts: Counter):
+    # the same counting as analyze_letter_frequency and analyze_word_frequency, for one piece of text
+    char_counts.update(text.lower())
+    word_counts.update(word.strip(string.punctuation).lower() for word in text.split()
+                       if any(char.isalpha() for char in word))
+
+
+def count_chunks(chunks, char_counts=None, word_counts=None):
+    # Single pass over all chunks: character and word counts, with words split across chunks put back together
+    # (any counters with an update(iterable) method can be passed in, e.g. ApproximateCounter)
+    char_counts = Counter() if char_counts is None else char_counts
+    word_counts = Counter() if word_counts is None else word_counts
+    carry = ""
+    for chunk in chunks:
+        ready, carry = split_at_last_whitespace(carry + chunk)
+        count_text(ready, char_counts, word_counts)
+        if len(carry) > MAX_CARRY:
+            # no whitespace for a very long time (e.g. binary data): don't keep copying an ever longer carry
+            count_text(carry, char_counts, word_counts)
+            carry = ""
+    count_text(carry, char_counts, word_counts)
+    return char_counts, word_counts
+
+
+def letter_statistics(char_counts: Counter):
+    # letter counts, number of different characters and non-letter counts, derived from the character counts
+    letter_counts = Counter({char: count for char, count in char_counts.items() if char.isalpha()})
+    non_alpha_char_counts = Counter({char: count for char, count in char_counts.items() if not char.isalpha()})
+    return letter_counts, len(char_counts), non_alpha_char_counts
+
+
+def analyze_file_streaming(filename, chunk_size=CHUNK_SIZE):
+    # Same results and reports as analyze_letter_frequency + analyze_word_frequency,
+    # but the file is never in memory as a whole
+    char_counts, word_counts = count_chunks(read_file_chunks(filename, chunk_size))
+    letter_counts, unique_char_counts, non_alpha_char_counts = letter_statistics(char_counts)
+    log_letter_frequency(letter_counts, non_alpha_char_counts)
+    log_word_frequency(word_counts)
+    return letter_counts, unique_char_counts, char_counts, word_counts, sum(word_counts.values())
+
 def log_word_percentages(word_counts, total_words):
     # Word percentage
-    logging.info("\n===== Word Percentages =====")
+    lines = ["\n===== Word Percentages ====="]
     # formatting of columns
-    logging.info(f"{'Word':<15} {'Occurrences':<12} {'Percentage (%)':<12}")
-    logging.info("-" * 40)
+    lines.append(f"{'Word':<15} {'Occurrences':<12} {'Percentage (%)':<12}")
+    lines.append("-" * 40)
     for word, count in word_counts.items():
         percentage = (count / total_words) * 100
-        logging.info(
+        lines.append(
             f"{word:<15} {count:<12} {percentage:<12.2f}")  # f for floating point number, displays with exactly 2 decimal spaces
+    log_section(lines)
 
 def log_top_10_words(word_counts, total_words):
     # Identify top 10 most frequent words
     top_10_words = word_counts.most_common(10)
     top_10_total = sum(count for _, count in top_10_words)
 
-    logging.info("\n===== Top 10 Most Frequently Used Words =====")
-    for word, count in top_10_words:
-        logging.info(f"'{word}': {count}")
+    lines = ["\n===== Top 10 Most Frequently Used Words ====="]
+    lines += [f"'{word}': {count}" for word, count in top_10_words]
 
     top_10_percentage = (top_10_total / total_words) * 100
-    logging.info(f"\nTop 10 words account for {top_10_percentage:.2f}% of the total words in the song.")
+    lines.append(f"\nTop 10 words account for {top_10_percentage:.2f}% of the total words in the song.")
+    log_section(lines)
 
-def reverse_content(content, output_filename):
+def reverse_content(content, output_filename, log_content=True):
     # Reverse the lyrics content
     reversed_content = content[::-1]
     # Save the reversed content to a new file
     with open(output_filename, 'w', encoding='utf-8') as file:
         file.write(reversed_content)
     # Print the reversed content to verify correctness
-    logging.info("\n===== Reversed Content of 'song.txt' =====")
-    logging.info(reversed_content)
+    if log_content:
+        logging.info("\n===== Reversed Content of 'song.txt' =====")
+        logging.info(reversed_content)
+
+
+def reversed_chunks(mapped, chunk_size=CHUNK_SIZE):
+    # The text of a memory-mapped UTF-8 file, reversed character by character, piece by piece from the end.
+    # A piece never starts in the middle of a UTF-8 character or between \r and \n
+    # (line breaks are translated like in text mode, so the result is the same as content[::-1])
+    end = len(mapped)
+    while end > 0:
+        start = max(end - chunk_size, 0)
+        while start > 0 and mapped[start] & 0xC0 == 0x80:  # continuation byte: go back to the character's first byte
+            start -= 1
+        if start > 0 and mapped[start] == 0x0A and mapped[start - 1] == 0x0D:
+            start -= 1
+        text = mapped[start:end].decode('utf-8').replace("\r\n", "\n").replace("\r", "\n")
+        yield text[::-1]
+        end = start
+
+
+def reverse_file(input_filename, output_filename, chunk_size=CHUNK_SIZE, log_content=False):
+    # Same result as reverse_content(read_file_contents(input_filename), ...), but only one chunk is
+    # in memory at a time (the file is memory-mapped and read backwards, the output written as it goes)
+    if log_content:
+        logging.info(f"\n===== Reversed Content of '{input_filename}' =====")
+    pending = ""  # reversed text not logged yet: it is logged line by line, never all at once
+    # (a line longer than longest_pending characters is logged in pieces, so pending never grows with the file)
+    longest_pending = max(chunk_size, CHUNK_SIZE)
+    with open(input_filename, 'rb') as source, open(output_filename, 'w', encoding='utf-8') as target:
+        if os.fstat(source.fileno()).st_size > 0:  # an empty file can't be memory-mapped
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for text in reversed_chunks(mapped, chunk_size):
+                    target.write(text)
+                    if log_content:
+                        pending += text
+                        last_line_break = pending.rfind("\n")
+                        if last_line_break != -1:
+                            logging.info(pending[:last_line_break])
+                            pending = pending[last_line_break + 1:]
+                        if len(pending) > longest_pending:
+                            logging.info(pending)
+                            pending = ""
+    if log_content:
+        logging.info(pending)
+
+
+def corpus_files(path):
+    # A directory (all .txt files in it and its subdirectories) or a glob pattern like "lyrics/*.txt"
+    if os.path.isdir(path):
+        path = os.path.join(path, "**", "*.txt")
+    return sorted(file for file in glob.glob(path, recursive=True) if os.path.isfile(file))
+
+
+def safe_boundary(file, offset, size):
+    # First position at or after offset where a file may be cut: right after a line break
+    # (never inside a UTF-8 character, a word or a \r\n pair); size if there is none
+    file.seek(offset)
+    while offset < size:
+        block = file.read(1 << 16)
+        newline = block.find(b"\n")
+        if newline != -1:
+            return offset + newline + 1
+        offset += len(block)
+    return size
+
+
+def corpus_tasks(filenames, task_size=CORPUS_TASK_SIZE):
+    # Split the corpus into tasks of about task_size bytes; a task is a list of (filename, start, end) ranges
+    tasks = [[]]
+    task_bytes = 0
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as file:
+            start = 0
+            while start < size:
+                end = safe_boundary(file, start + max(task_size - task_bytes, 1), size)
+                tasks[-1].append((filename, start, end))
+                task_bytes += end - start
+                if task_bytes >= task_size:
+                    tasks.append([])
+                    task_bytes = 0
+                start = end
+    return [task for task in tasks if task]
+
+
+def read_range(filename, start, end):
+    # One piece of a file as text, with line breaks translated like in text mode
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def count_task(task):
+    # MAP: character and word counts of all ranges of one task (runs in a worker process)
+    char_counts = Counter()
+    word_counts = Counter()
+    for filename, start, end in task:
+        count_text(read_range(filename, start, end), char_counts, word_counts)
+    return char_counts, word_counts
+
+
+def merge_counts(left, right):
+    char_counts, word_counts = left
+    char_counts.update(right[0])
+    word_counts.update(right[1])
+    return char_counts, word_counts
+
+
+def counted_in_order(pool, tasks, window):
+    # MAP on the pool with at most 'window' tasks submitted at a time; the results come back in the order
+    # of the corpus (so the counters list equal counts in the same order as a single-process run)
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(count_task, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def count_corpus(path, workers=None, task_size=CORPUS_TASK_SIZE):
+    # Character and word counts of all files of a corpus, counted in parallel by a pool of processes
+    # REDUCE: every partial result is merged into the totals as soon as it is next in line, so only the
+    # few partials of the tasks in flight are ever held, however big the corpus is
+    tasks = corpus_tasks(corpus_files(path), task_size)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    totals = Counter(), Counter()
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            merge_counts(totals, count_task(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in counted_in_order(pool, tasks, 2 * workers):
+                merge_counts(totals, partial)
+    return totals
+
+
+def analyze_corpus(path, workers=None, console=True):
+    # The usual character and word reports, for the whole corpus at once
+    configure_logging(console)
+    char_counts, word_counts = count_corpus(path, workers)
+    total_words = sum(word_counts.values())
+    analyze_character_usage(char_counts)
+    log_word_percentages(word_counts, total_words)
+    log_top_10_words(word_counts, total_words)
+    logging.info("\nAnalysis complete. Results logged to execution_log.txt.")
+    return char_counts, word_counts
+
+
+class CountMinSketch:
+    # Fixed-size table of depth rows x width counters; every item adds to one counter per row and its
+    # estimate is the smallest of those counters: never too low, and at most epsilon * total too high
+    # with probability 1 - delta (width = e / epsilon, depth = ln(1 / delta))
+    def __init__(self, epsilon=1e-4, delta=1e-3):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = array('q', [0]) * (self.width * self.depth)
+        self.total = 0
+
+    def positions(self, item):
+        # one counter per row from two halves of one hash (no separate hash function per row needed)
+        h = hash(item)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        table = self.table
+        for position in self.positions(item):
+            table[position] += count
+        self.total += count
+
+    def estimate(self, item):
+        table = self.table
+        return min(table[position] for position in self.positions(item))
+
+
+class MisraGries:
+    # At most k counters: a new item takes a free counter, and when there is none every counter
+    # goes down by one. Every item seen more than total / (k + 1) times keeps its counter, and every
+    # counter is at most total / (k + 1) lower than the true count
+    def __init__(self, k):
+        self.k = k
+        self.counters = {}
+        self.total = 0
+
+    def add(self, item, count=1):
+        self.total += count
+        counters = self.counters
+        if item in counters:
+            counters[item] += count
+            return
+        if len(counters) < self.k:
+            counters[item] = count
+            return
+        # no free counter: take away as much as possible from everybody (the new item included)
+        decrement = min(count, min(counters.values()))
+        count -= decrement
+        for key in list(counters):
+            counters[key] -= decrement
+            if counters[key] == 0:
+                del counters[key]
+        if count > 0 and len(counters) < self.k:
+            counters[item] = count
+
+    def error_bound(self):
+        # counts that were decremented away, divided between at least k + 1 items
+        return (self.total - sum(self.counters.values())) / (self.k + 1)
+
+
+class ApproximateCounter:
+    # Bounded memory replacement for Counter in the reports: the Misra-Gries counters pick the candidates
+    # for the most frequent items, the Count-Min Sketch gives their counts
+    # (the true count of a candidate is between its Misra-Gries counter and its sketch estimate)
+    def __init__(self, epsilon=1e-4, delta=1e-3, candidates=None):
+        self.sketch = CountMinSketch(epsilon, delta)
+        self.heavy_hitters = MisraGries(candidates or math.ceil(1 / epsilon))
+
+    def update(self, items):
+        sketch_add = self.sketch.add
+        heavy_hitters_add = self.heavy_hitters.add
+        for item in items:
+            sketch_add(item)
+            heavy_hitters_add(item)
+
+    def __getitem__(self, item):
+        return self.sketch.estimate(item)
+
+    def __contains__(self, item):
+        # no false "not seen", but with a small chance an unseen item looks seen
+        return self.sketch.estimate(item) > 0
+
+    def __len__(self):
+        return len(self.heavy_hitters.counters)
+
+    def total(self):
+        return self.sketch.total
+
+    def most_common(self, n=None):
+        candidates = sorted(((item, self.sketch.estimate(item)) for item in self.heavy_hitters.counters),
+                            key=lambda pair: pair[1], reverse=True)
+        return candidates if n is None else candidates[:n]
+
+    def achieved_error(self, items):
+        # largest gap between the upper (sketch) and lower (Misra-Gries) bound of the given items
+        return max((self.sketch.estimate(item) - self.heavy_hitters.counters.get(item, 0) for item in items),
+                   default=0)
+
+
+def log_approximation_error(counts: ApproximateCounter, name, top_n=10):
+    sketch = counts.sketch
+    top = [item for item, _ in counts.most_common(top_n)]
+    log_section([
+        f"\n===== Approximation error ({name}) =====",
+        f"Counted: {sketch.total}, memory: {sketch.width} x {sketch.depth} sketch counters "
+        f"+ {counts.heavy_hitters.k} candidate counters",
+        f"Guaranteed: every count is at most {sketch.epsilon * sketch.total:.1f} too high "
+        f"(epsilon = {sketch.epsilon}) with probability {1 - sketch.delta:.4f}",
+        f"Guaranteed: every {name[:-1]} seen more than {counts.heavy_hitters.error_bound():.1f} "
+        f"times is a candidate",
+        f"Achieved: the top {top_n} counts are at most {counts.achieved_error(top)} too high",
+    ])
+
+
+def analyze_file_approximate(filename, epsilon=1e-4, delta=1e-3, chunk_size=CHUNK_SIZE, console=True):
+    # Character and top 10 word reports with bounded memory, however many different words the text has
+    configure_logging(console)
+    char_counts = ApproximateCounter(epsilon, delta)
+    word_counts = ApproximateCounter(epsilon, delta)
+    count_chunks(read_file_chunks(filename, chunk_size), char_counts, word_counts)
+    analyze_character_usage(char_counts)
+    log_approximation_error(char_counts, "characters", 5)
+    log_top_10_words(word_counts, word_counts.total())
+    log_approximation_error(word_counts, "words")
+    logging.info("\nAnalysis complete. Results logged to execution_log.txt.")
+    return char_counts, word_counts
+
+
+def analyze_large_file(filename, console=True):
+    # Reports for a file of any size (without printing or reversing its whole content)
+    configure_logging(console)
+    letter_counts, unique_char_counts, char_counts, word_counts, total_words = analyze_file_streaming(filename)
+    analyze_character_usage(char_counts)
+    log_word_percentages(word_counts, total_words)
+    log_top_10_words(word_counts, total_words)
+    logging.info("\nAnalysis complete. Results logged to execution_log.txt.")
 
 
-def main():
-    configure_logging()
+def main(console=True):
+    configure_logging(console)
     save_lyrics_to_file('song.txt', lyrics)
     content = read_file_contents('song.txt')
 
@@ -150,11 +540,25 @@ def main():
     log_word_percentages(word_counts, total_words)
     log_top_10_words(word_counts, total_words)
 
-    reverse_content(content, 'reversed.txt')
+    reverse_file('song.txt', 'reversed.txt', log_content=True)
 
     logging.info("\nAnalysis complete. Results logged to execution_log.txt.")
 
 
 # ensures that main functions runs only when script is directly executed
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # "--quiet" anywhere: results only go to execution_log.txt, not to the console
+    console = "--quiet" not in sys.argv
+    if not console:
+        sys.argv.remove("--quiet")
+    # "python Exercise_4.py some_file.txt" analyzes that file in streaming mode,
+    # "python Exercise_4.py some_directory" or "python Exercise_4.py 'songs/*.txt'" a whole corpus in parallel,
+    # "python Exercise_4.py --approximate some_file.txt" with bounded memory
+    if len(sys.argv) > 2 and sys.argv[1] == "--approximate":
+        analyze_file_approximate(sys.argv[2], console=console)
+    elif len(sys.argv) > 1 and (os.path.isdir(sys.argv[1]) or any(char in sys.argv[1] for char in "*?[")):
+        analyze_corpus(sys.argv[1], console=console)
+    elif len(sys.argv) > 1:
+        analyze_large_file(sys.argv[1], console=console)
+    else:
+        main(console=console)
\ No newline at end of file
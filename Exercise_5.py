@@ -1,6 +1,26 @@
+import asyncio                    # Standard Python library for asynchronous I/O (for the search server)
 import json                       # Standard Python library for parsing and generating JSON data
-import requests                   # Third-party library (installed via pip) to make HTTP requests (for fetching sonnets)
-from nltk.stem.porter import PorterStemmer  # From the NLTK library, the Porter stemmer is used to reduce words to their stem
+import concurrent.futures         # Standard Python library for process/thread pools (parallel build, search server)
+import contextlib                 # Standard Python library, turns a generator into a 'with' context manager
+import functools                  # Standard Python library, provides lru_cache (for memoized stemming)
+import heapq                      # Standard Python library for binary heaps (for top-k ranking)
+import itertools                  # Standard Python library for iterator helpers
+import math                       # Standard Python library for math functions (for BM25)
+import mmap                       # Standard Python library to map files into memory (for the on-disk index)
+import os                         # Standard Python library for file system helpers
+import re                         # Standard Python library for regular expressions (for the query parser)
+import shutil                     # Standard Python library to copy file contents (for the on-disk index)
+import struct                     # Standard Python library to pack/unpack binary data (for the on-disk index)
+import sys                        # Standard Python library for command-line arguments
+import threading                  # Standard Python library for threads (for background segment merging)
+import urllib.parse               # Standard Python library to parse URLs (for the search server)
+from array import array           # Standard Python library for compact typed arrays (for posting lists)
+from bisect import bisect_left    # Standard Python library for binary search in sorted sequences
+from collections import Counter, OrderedDict  # Standard Python library to count tokens, and an LRU-ordered dict
+from collections.abc import ItemsView, Mapping, ValuesView  # Standard Python library, dict views for MappedIndex
+from http import HTTPStatus       # Standard Python library with the HTTP status phrases (for the search server)
+# NOTE: the third-party libraries 'requests' (to fetch the sonnets) and 'nltk' (for the Porter stemmer)
+# are imported only where they are first needed, so importing this module stays fast
 
 # --------------------------------------------------------------------------------
 # PART 1: FETCH DATA FROM THE POETRYDB API AND SAVE IT LOCALLY
@@ -9,28 +29,231 @@ from nltk.stem.porter import PorterStemmer  # From the NLTK library, the Porter
 # The endpoint for Shakespeare's sonnets in JSON format
 url = "https://poetrydb.org/author,title/Shakespeare;Sonnet"
 
-# Make a GET request to the specified URL to retrieve the data
-response = requests.get(url)
+# The downloaded sonnets are cached in this file (stored exactly as received, not re-formatted)
+sonnets_path = "shakespeare_sonnets.json"
 
-# We'll store the downloaded sonnets here in an empty initialized list
-sonnets_data = []
 
-# Check if the HTTP request was successful (status code 200 indicates success)
-if response.status_code == 200:
-    # If successful, parse the response content as JSON
-    sonnets_data = response.json()
+def download_if_changed(url: str, path: str, chunk_size: int = 1 << 16) -> bool:
+    """
+    Downloads 'url' to 'path', streaming the body to disk chunk by chunk (never holding it in memory).
+
+    Next to the file we keep '<path>.meta.json' with the server's ETag / Last-Modified headers:
+      - If the file is complete, we send a conditional request (If-None-Match / If-Modified-Since);
+        an unchanged source answers 304 and is not downloaded again
+      - If a previous download was interrupted, the bytes received so far are in '<path>.part' and
+        we resume with a Range request (If-Range makes the server send everything again if the
+        source changed in the meantime); if the server can't resume at exactly that byte (416, or a
+        Content-Range starting elsewhere), the partial file is dropped and everything is fetched again
+
+    :return: True if new content was downloaded, False if the stored copy is still up to date
+    :raises requests.RequestException: If the request fails (network error or error status code)
+    """
+    import requests   # Imported here, so that importing this module doesn't pay for it
+
+    meta_path = path + ".meta.json"
+    partial_path = path + ".part"
+
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+    validator = meta.get("etag") or meta.get("last_modified")
+
+    # 'identity' keeps byte offsets of the stored file and the server's representation in sync (for Range)
+    headers = {"Accept-Encoding": "identity"}
+    resume_from = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    if resume_from and validator and not meta.get("complete"):
+        headers["Range"] = f"bytes={resume_from}-"
+        headers["If-Range"] = validator
+    elif os.path.exists(path) and meta.get("complete"):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 304:
+            return False
+        if "Range" in headers and (response.status_code == 416 or (
+                response.status_code == 206 and content_range_start(response) != resume_from)):
+            # The server can't continue exactly where we stopped: throw the partial file away, fetch everything
+            os.remove(partial_path)
+            return download_if_changed(url, path, chunk_size)
+        response.raise_for_status()
+
+        # 206 = the server continues where we stopped; 200 = the whole content (again)
+        mode = "ab" if response.status_code == 206 else "wb"
+
+        # Remember the validators before writing, so an interrupted download can be resumed
+        meta = {"etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "complete": False}
+        with open(meta_path, "w") as file:
+            json.dump(meta, file)
+
+        with open(partial_path, mode) as file:
+            for chunk in response.iter_content(chunk_size):
+                file.write(chunk)
+
+    os.replace(partial_path, path)
+    meta["complete"] = True
+    with open(meta_path, "w") as file:
+        json.dump(meta, file)
+    return True
+
+
+def content_range_start(response):
+    """
+    :return: The first byte position of a 206 response's Content-Range header, None if it is missing or invalid
+    """
+    match = re.match(r"bytes\s+(\d+)-", response.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+
+def iter_json_records(file, chunk_size: int = 1 << 16):
+    """
+    Incrementally parses JSON objects from a text file, reading 'chunk_size' characters at a time.
+    Works for a top-level JSON array of objects (like the PoetryDB response) as well as for
+    JSON Lines (one object per line). Only the record currently being parsed is kept in memory.
+
+    :return: A generator of the parsed records (dicts)
+    :raises ValueError: If the file contains invalid JSON or a record that is not an object
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    end_of_file = False
+
+    while True:
+        # Skip what separates the records: whitespace, commas and the brackets of a top-level array
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+
+        if position < len(buffer):
+            try:
+                record, position_after = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                # Read on only if the record may simply continue in the next chunk: the parser ran into
+                # the end of the buffer (inside a string, or in the last few characters, e.g. in a number
+                # or an escape). Any other error is a corrupt record, reported without reading further.
+                incomplete = error.msg.startswith("Unterminated string") or len(buffer) - error.pos <= 16
+                if end_of_file or not incomplete:
+                    raise
+            else:
+                if not isinstance(record, dict):
+                    raise ValueError(f"Expected a JSON object, got {type(record).__name__}")
+                yield record
+                position = position_after
+                continue
+
+        if end_of_file:
+            return
+
+        # Drop what was consumed and read the next chunk
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        end_of_file = not chunk
+
+
+def iter_sonnets(source: str, cache_path: str = sonnets_path):
+    """
+    Streams Sonnet objects from a local JSON/JSONL file or from an HTTP(S) URL.
+    A URL is first downloaded to 'cache_path' (only if it changed, see download_if_changed()).
+    The generator can be fed straight into Index(...) or SegmentedIndex.add().
+
+    Records without a title or lines (e.g. an error object from the API) are skipped.
+    """
+    if source.startswith(("http://", "https://")):
+        download_if_changed(source, cache_path)
+        source = cache_path
+
+    with open(source, "r", encoding="utf-8") as file:
+        for record in iter_json_records(file):
+            if "title" in record and "lines" in record:
+                yield Sonnet(record)
+
+
+# NOTE: nothing is downloaded when this module is imported; SearchEngine (PART 7) calls
+# download_if_changed() the first time the sonnets are actually needed.
+
+# --------------------------------------------------------------------------------
+# PART 1b: SHARED TOKENIZER SERVICE
+# --------------------------------------------------------------------------------
+
+class Tokenizer:
+    """
+    Turns lines of text into stemmed tokens. One instance is shared by all Documents, so:
+      - The punctuation removal is compiled once into a str.translate table
+      - Only one PorterStemmer exists, instead of one per Sonnet/Query
+      - Each distinct word form is stemmed only once, through a bounded LRU cache
+        (words like "thy" or "love" occur thousands of times in a corpus)
+      - NLTK is only imported when the first word is stemmed
+    """
+
+    def __init__(self, chars_to_remove: str = ".,':;!?", cache_size: int = 65536):
+        """
+        :param chars_to_remove: Punctuation characters that are deleted before splitting
+        :param cache_size: How many distinct word forms the stemming cache remembers
+        """
+        # Translation table that maps every character to remove to None (= delete it)
+        self.translation_table = str.maketrans("", "", chars_to_remove)
+        self.stemmer = None   # Created on first use, see _stem()
+        # Wrap the stemmer in an LRU cache: repeated words are answered from the cache
+        self.stem = functools.lru_cache(maxsize=cache_size)(self._stem)
+
+    def _stem(self, word: str) -> str:
+        if self.stemmer is None:
+            # From the NLTK library, the Porter stemmer is used to reduce words to their stem
+            from nltk.stem.porter import PorterStemmer
+            self.stemmer = PorterStemmer()
+        return self.stemmer.stem(word)
+
+    def words(self, lines: list[str]) -> list[str]:
+        """
+        Lowercases the lines, removes the punctuation and splits on whitespace (no stemming yet).
+        """
+        words = []
+        for line in lines:
+            words.extend(line.lower().translate(self.translation_table).split())
+        return words
+
+    def tokenize(self, lines: list[str]) -> list[str]:
+        """
+        :param lines: The lines of one document
+        :return: The stemmed tokens, in order of occurrence
+        """
+        stem = self.stem
+        return [stem(word) for word in self.words(lines)]
+
+    def tokenize_lines(self, lines: list[str]) -> list[list[str]]:
+        """
+        Like tokenize(), but keeps the lines apart (needed to know where each token occurs).
+        :return: One token list per line
+        """
+        return [self.tokenize([line]) for line in lines]
+
+    def tokenize_many(self, documents: list["Document"]) -> list[list[str]]:
+        """
+        Tokenizes a whole batch of documents in one call.
+        Every distinct word form in the batch is stemmed exactly once, and the stems are then
+        looked up from a plain dict, which is cheaper than going through the LRU cache per word.
+        :return: One token list per document, in the same order as 'documents'
+        """
+        word_lists = [self.words(document.lines) for document in documents]
+
+        # Stem each distinct surface form once for the whole batch
+        stems = {}
+        for words in word_lists:
+            for word in words:
+                if word not in stems:
+                    stems[word] = self.stem(word)
+
+        return [[stems[word] for word in words] for words in word_lists]
 
-    # Open or create a file named 'shakespeare_sonnets.json' for writing
-    with open("shakespeare_sonnets.json", "w") as file:
-        # Write the sonnets data in nicely formatted JSON (indent=4 for readability)
-        # pretty-print the resulting JSON with an indentation of 4 spaces for each nested level
-        json.dump(sonnets_data, file, indent=4)
 
-    # Print how many sonnets were successfully fetched
-    print(f"Fetched and stored {len(sonnets_data)} sonnets.")
-else:
-    # If the HTTP request was not successful, display an error message with the status code
-    print(f"Failed to fetch sonnets. Status code: {response.status_code}")
+# The one tokenizer used by every Document, Sonnet and Query
+tokenizer = Tokenizer()
 
 # --------------------------------------------------------------------------------
 # PART 2: DOCUMENT BASE CLASS
@@ -49,7 +272,6 @@ class Document:
         :param lines: a list of strings (each string is one 'line' of the document)
         """
         self.lines = lines                   # Store the lines of text for further processing
-        self.stemmer = PorterStemmer()       # Create a PorterStemmer object to handle word stemming
 
     def tokenize(self) -> list[str]:
         """
@@ -58,33 +280,10 @@ class Document:
           - Removal of specific punctuation
           - Splitting on whitespace
           - Stemming each word
+        The work is done by the shared Tokenizer, so no stemmer is created per document.
         :return: A list of processed tokens (strings)
         """
-        # Characters to remove from the lines before splitting
-        chars_to_remove = ".,':;!?"
-
-        # empty list will hold all the final tokens produced from the document
-        tokens = []
-
-        # Iterate over each line in the document
-        for line in self.lines:
-            # Convert the entire line to lowercase to normalize text
-            line = line.lower()
-
-            # Remove specific punctuation marks by replacing them with an empty string
-            for c in chars_to_remove:
-                line = line.replace(c, "")
-
-            # Split the cleaned line into separate words/tokens by whitespace
-            words = line.split()
-
-            # Apply the Porter stemmer to each token to reduce it to its stem
-            stemmed_words = [self.stemmer.stem(word) for word in words]
-
-            # Extend our token list with these newly processed tokens
-            tokens.extend(stemmed_words)
-
-        return tokens  # Return the final list of processed tokens
+        return tokenizer.tokenize(self.lines)
 
 # --------------------------------------------------------------------------------
 # PART 3: SONNET CLASS
@@ -146,54 +345,219 @@ class Sonnet(Document):
 # PART 4: CREATE SONNET INSTANCES
 # --------------------------------------------------------------------------------
 
-# Convert each dictionary from the fetched data into a Sonnet object
-sonnet_instances = [Sonnet(s) for s in sonnets_data]
+# Sonnet objects are created on demand by SearchEngine.sonnets (PART 7), not at import time.
+
+# --------------------------------------------------------------------------------
+# PART 4b: SORTED POSTING LISTS
+# --------------------------------------------------------------------------------
+
+# Posting lists are arrays of unsigned ints: 4 bytes per document ID instead of a set entry
+POSTINGS_TYPECODE = "I"
+
+
+def gallop_to(postings: array, target: int, low: int) -> int:
+    """
+    Finds the first position >= low whose ID is >= target ("galloping" / exponential search).
+    We probe low+1, low+2, low+4, ... until we overshoot, then binary-search only that last
+    window. Skipping ahead this way costs O(log distance) instead of walking over every ID.
+    """
+    size = len(postings)
+    step = 1
+    high = low
+    while high < size and postings[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+    return bisect_left(postings, target, low, min(high, size))
+
+
+def intersect_postings(posting_lists: list) -> array:
+    """
+    Intersects sorted posting lists, starting with the smallest one.
+    The result can never be larger than the smallest list, so every further step only has to
+    look up a few IDs in a (possibly huge) list, which galloping does without scanning it.
+    :return: The sorted IDs contained in every list
+    """
+    if not posting_lists:
+        return array(POSTINGS_TYPECODE)
+
+    lists = sorted(posting_lists, key=len)
+    result = array(POSTINGS_TYPECODE, lists[0])
+
+    for other in lists[1:]:
+        matches = array(POSTINGS_TYPECODE)
+        position = 0
+        for doc_id in result:
+            position = gallop_to(other, doc_id, position)
+            if position == len(other):
+                break  # The other list is exhausted, no further IDs can match
+            if other[position] == doc_id:
+                matches.append(doc_id)
+        result = matches
+
+        # If at any point the intersection is empty, no documents can match all lists
+        if not result:
+            break
+
+    return result
+
+
+def union_postings(posting_lists: list) -> array:
+    """
+    Merges sorted posting lists into one sorted list without duplicates (for OR).
+    """
+    result = array(POSTINGS_TYPECODE)
+    for doc_id in heapq.merge(*posting_lists):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def subtract_postings(postings: array, excluded: array) -> array:
+    """
+    Returns the IDs of 'postings' that are not in 'excluded' (for NOT), galloping through 'excluded'.
+    """
+    result = array(POSTINGS_TYPECODE)
+    position = 0
+    for doc_id in postings:
+        position = gallop_to(excluded, doc_id, position)
+        if position == len(excluded) or excluded[position] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def contains_phrase(lines_of_positions, phrase: list[str]) -> bool:
+    """
+    Checks whether the phrase tokens occur consecutively within one line.
+    :param lines_of_positions: The document's tokens, one list per line
+    """
+    length = len(phrase)
+    for line_tokens in lines_of_positions:
+        for offset in range(len(line_tokens) - length + 1):
+            if line_tokens[offset:offset + length] == phrase:
+                return True
+    return False
+
+# Index.__init__ tokenizes this many Sonnets per batch, so a stream of Sonnets is never
+# materialized as one big list of token lists
+INDEX_BATCH_SIZE = 1024
+
+# BM25 parameters: K1 controls how quickly repeated occurrences stop adding score,
+# B controls how strongly long documents are penalized
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class _RankedTerm:
+    """
+    A cursor over one query token's posting list, used by Index.rank().
+    """
+
+    def __init__(self, postings: array, frequencies: array, idf: float, upper_bound: float):
+        self.postings = postings
+        self.frequencies = frequencies
+        self.idf = idf
+        self.upper_bound = upper_bound   # The highest score this token can add to any document
+        self.position = 0                # Index of the current entry in the posting list
+
+    def current(self):
+        """The doc ID under the cursor, or None if the posting list is exhausted."""
+        return self.postings[self.position] if self.position < len(self.postings) else None
 
-# Print a brief overview: the ID and title of each Sonnet
-for s in sonnet_instances:
-    print(f"Sonnet {s.id}: {s.title}")
+
+class _CollectionStatistics:
+    """
+    The corpus-wide numbers BM25 scores depend on. Index.rank() normally takes them from its own
+    index; SegmentedIndex computes them once over all its live Sonnets and hands the same numbers
+    to every part, so the parts' scores are comparable (and equal to those of a one-shot build).
+    """
+
+    def __init__(self, document_count: int, average_length: float, shortest_length: int,
+                 document_frequencies: dict[str, int]):
+        self.document_count = document_count
+        self.average_length = average_length
+        self.shortest_length = shortest_length
+        self.document_frequencies = document_frequencies   # token -> number of documents containing it
 
 # --------------------------------------------------------------------------------
 # PART 5: INVERTED INDEX CLASS (with 'add' method)
 # --------------------------------------------------------------------------------
 
-class Index(dict[str, set[int]]):
+class Index(dict[str, array]):
     """
     Represents an inverted index, which is a dictionary where:
       - key: token (a string, e.g. 'love')
-      - value: set of document IDs where that token appears
+      - value: sorted array of the document IDs where that token appears (a "posting list")
+
+    This class inherits from Python's built-in 'dict'. The posting lists are compact
+    integer arrays (4 bytes per ID) instead of sets, and because they are sorted they can be
+    intersected by skipping ahead instead of hashing every ID.
 
-    This class inherits from Python's built-in 'dict' but we store sets of ints as values.
+    For ranked retrieval (see rank()) the index additionally keeps:
+      - frequencies: token -> array of term frequencies, parallel to the token's posting list
+      - document_lengths: doc ID -> number of tokens in that document
     """
 
     def __init__(self, documents: list[Sonnet]):
         """
         :param documents: A list of Sonnet objects. We'll build an inverted index from them.
+                          Any iterable works, e.g. the generator returned by iter_sonnets().
         """
         super().__init__()            # Initialize the parent 'dict' structure
-        self.documents = documents    # Keep a reference to the original list of Sonnets
+        self.documents = []           # The indexed Sonnets, in the order they were given
 
-        # Add each Sonnet object to the index by calling our 'add' method below
-        for document in documents:
-            self.add(document)
+        # Doc-ID -> Sonnet table, so search() can turn IDs back into Sonnets in O(1)
+        self.documents_by_id = {}
 
-    def add(self, document: Sonnet):
+        # Statistics needed for BM25 scoring
+        self.frequencies = {}         # token -> term frequencies, parallel to self[token]
+        self.document_lengths = {}    # doc ID -> number of tokens
+
+        # Tokenize the Sonnets in batches (each distinct word is stemmed only once per batch),
+        # then add each Sonnet object to the index by calling our 'add' method below
+        documents = iter(documents)
+        while batch := list(itertools.islice(documents, INDEX_BATCH_SIZE)):
+            self.documents.extend(batch)
+            for document, tokens in zip(batch, tokenizer.tokenize_many(batch)):
+                self.add(document, tokens)
+
+    def add(self, document: Sonnet, tokens: list[str] = None):
         """
         Processes a single Sonnet, tokenizes it, and updates the inverted index.
 
-        For each token in the Sonnet, we add 'document.id' to the set of IDs mapped by that token.
+        For each token in the Sonnet, we add 'document.id' to the posting list of that token,
+        keeping the list sorted and free of duplicates, and record how often the token occurs.
+        :param tokens: The Sonnet's tokens, if they were already computed (e.g. by a batch call)
         """
         # Use the inherited tokenize() method (from Document, used by Sonnet) to get the tokens
-        tokens = document.tokenize()
-
-        # Go through each token in this Sonnet
-        for token in tokens:
-            # If the token is not already a key in our dictionary, create an empty set for it
-            if token not in self:
-                self[token] = set()
-
-            # Add this Sonnet's ID to the set of IDs for this token
-            self[token].add(document.id)
+        if tokens is None:
+            tokens = document.tokenize()
+
+        doc_id = document.id
+        self.documents_by_id[doc_id] = document
+        self.document_lengths[doc_id] = len(tokens)
+
+        # Go through each distinct token in this Sonnet, together with how often it occurs
+        for token, count in Counter(tokens).items():
+            # If the token is not already a key in our dictionary, create an empty posting list for it
+            postings = self.get(token)
+            if postings is None:
+                postings = self[token] = array(POSTINGS_TYPECODE)
+                self.frequencies[token] = array(POSTINGS_TYPECODE)
+            frequencies = self.frequencies[token]
+
+            if not postings or postings[-1] < doc_id:
+                # The usual case: documents are added in increasing ID order, so we just append
+                postings.append(doc_id)
+                frequencies.append(count)
+            else:
+                # Out-of-order ID: insert it at its sorted position (or update it if it's already there)
+                position = bisect_left(postings, doc_id)
+                if position < len(postings) and postings[position] == doc_id:
+                    frequencies[position] = count
+                else:
+                    postings.insert(position, doc_id)
+                    frequencies.insert(position, count)
 
 # --------------------------------------------------------------------------------
 # REDEFINE INDEX CLASS TO INCLUDE 'search' METHOD
@@ -202,53 +566,972 @@ class Index(dict[str, set[int]]):
 
     def search(self, query: "Query") -> list[Sonnet]:
         """
-        Return all Sonnets that contain EVERY token in the given Query object.
+        Return all Sonnets that match the given Query object.
+
+        Plain words must ALL occur (implicit AND), e.g. "love hate". The query language
+        also supports AND, OR, NOT, parentheses and quoted phrases (see Query.parse()).
 
         Steps:
-          1. Tokenize the query (same process as with Sonnets)
-          2. For each token in the query, find the set of document IDs in the index
-          3. Intersect those sets (because we want docs that contain ALL tokens)
-          4. Convert the final set of document IDs back to Sonnet objects
-          5. Return that list of matching Sonnet objects
+          1. Parse the query into a tree of Term/Phrase/And/Or/Not nodes
+          2. Evaluate the tree to a sorted list of document IDs (see evaluate())
+          3. Convert the final document IDs back to Sonnet objects via the doc-ID table
+          4. Return that list of matching Sonnet objects
+        :raises ValueError: If the query is not well-formed (e.g. an unbalanced parenthesis)
         """
-        # Convert the query into tokens
-        query_tokens = query.tokenize()
+        node = query.parse()
 
         # If the query is empty (no tokens), there can be no matches
-        if not query_tokens:
+        if node is None:
             return []
 
-        # We start with the set of IDs from the first token
-        first_token = query_tokens[0]
-        if first_token not in self:
-            # If the first token doesn't exist in the index at all, no documents will match
+        matching_ids = self.evaluate(node)
+
+        # Convert the matching IDs to Sonnet objects with one dictionary lookup each
+        return [self.documents_by_id[doc_id] for doc_id in matching_ids]
+
+    def document_frequency(self, token: str) -> int:
+        """How many documents contain the token."""
+        return len(self.get(token, ()))
+
+    def all_ids(self) -> array:
+        """The sorted IDs of all indexed documents (the starting point for a pure NOT)."""
+        return array(POSTINGS_TYPECODE, sorted(self.document_lengths))
+
+    def estimate(self, node: "QueryNode") -> int:
+        """
+        Query planner: estimates how many documents a query node matches, using only
+        posting-list sizes. Cheap nodes (small estimates) are evaluated first.
+        """
+        document_count = len(self.document_lengths)
+        if isinstance(node, Term):
+            return self.document_frequency(node.token)
+        if isinstance(node, Phrase):
+            # A phrase can't match more documents than its rarest token
+            return min(self.document_frequency(token) for token in node.tokens)
+        if isinstance(node, Not):
+            return document_count - self.estimate(node.child)
+        if isinstance(node, Or):
+            return min(document_count, sum(self.estimate(child) for child in node.children))
+        # And: bounded by its most selective positive part
+        return min((self.estimate(child) for child in node.children if not isinstance(child, Not)),
+                   default=document_count)
+
+    def evaluate(self, node: "QueryNode") -> array:
+        """
+        Evaluates a parsed query to the sorted array of matching document IDs.
+        """
+        if isinstance(node, Term):
+            return self[node.token] if node.token in self else array(POSTINGS_TYPECODE)
+        if isinstance(node, Phrase):
+            return self._evaluate_and([node])
+        if isinstance(node, Not):
+            return subtract_postings(self.all_ids(), self.evaluate(node.child))
+        if isinstance(node, Or):
+            return union_postings([self.evaluate(child) for child in node.children])
+        return self._evaluate_and(node.children)
+
+    def _evaluate_and(self, children: list["QueryNode"]) -> array:
+        """
+        Evaluates an AND of query nodes, in the cheapest order:
+          1. All plain tokens (including the tokens of every phrase) are intersected at once,
+             smallest posting list first
+          2. Other sub-expressions (e.g. an OR in parentheses) are intersected next, by estimated size
+          3. NOT parts are subtracted from the (by now small) candidate list
+          4. Phrases are verified last, only on the candidates that survived everything else
+        """
+        tokens = []
+        phrases = []
+        negated = []
+        others = []
+        for child in children:
+            if isinstance(child, Term):
+                tokens.append(child.token)
+            elif isinstance(child, Phrase):
+                tokens.extend(child.tokens)
+                phrases.append(child)
+            elif isinstance(child, Not):
+                negated.append(child)
+            else:
+                others.append(child)
+
+        candidates = None
+        if tokens:
+            for token in tokens:
+                if token not in self:
+                    # If any token doesn't exist in the index at all, no documents will match
+                    return array(POSTINGS_TYPECODE)
+            candidates = intersect_postings([self[token] for token in set(tokens)])
+
+        for other in sorted(others, key=self.estimate):
+            if candidates is not None and not candidates:
+                return candidates
+            ids = self.evaluate(other)
+            candidates = ids if candidates is None else intersect_postings([candidates, ids])
+
+        if candidates is None:
+            # Only NOT parts: start from all documents
+            candidates = self.all_ids()
+
+        for child in negated:
+            if not candidates:
+                return candidates
+            candidates = subtract_postings(candidates, self.evaluate(child.child))
+
+        for phrase in phrases:
+            candidates = array(POSTINGS_TYPECODE, (doc_id for doc_id in candidates
+                                                   if self.phrase_in_document(doc_id, phrase.tokens)))
+        return candidates
+
+    def phrase_in_document(self, doc_id: int, phrase: list[str]) -> bool:
+        """
+        Checks whether the phrase occurs in the document. A plain Index stores no positions, so the
+        candidate document is re-tokenized (cheap thanks to the stemming cache); PositionalIndex
+        answers this from its stored positions instead.
+        """
+        document = self.documents_by_id.get(doc_id)
+        if document is None:
+            return False  # E.g. a deleted Sonnet that is still stored in a SegmentedIndex segment
+        return contains_phrase(tokenizer.tokenize_lines(document.lines), phrase)
+
+    def postings_with_frequencies(self, token: str) -> tuple[array, array]:
+        """
+        :return: The token's posting list and the parallel term frequencies
+        """
+        return self[token], self.frequencies[token]
+
+    def rank(self, query: "Query", k: int = 10, excluded: set[int] = frozenset(),
+             statistics: _CollectionStatistics = None) -> list[tuple[Sonnet, float]]:
+        """
+        Ranked retrieval: return the k Sonnets with the highest BM25 score for the query.
+        Unlike search(), a Sonnet does not have to contain every query token - more (and rarer)
+        matching tokens simply score higher.
+
+        BM25 score of a document d for a query q:
+            sum over tokens t in q of  idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(d) / avg_len))
+        with idf(t) = ln(1 + (N - df + 0.5) / (df + 0.5)).
+
+        To avoid scoring the whole corpus we use the MaxScore algorithm:
+          - Every token gets an upper bound: the highest score it can add to any document
+          - A bounded min-heap keeps the best k documents so far; its smallest score is the threshold
+          - Tokens whose upper bounds together cannot beat the threshold are "non-essential":
+            documents containing only those tokens are never even looked at
+          - Candidate documents come from the remaining "essential" tokens, and scoring a
+            candidate stops as soon as its best possible score can no longer beat the threshold
+
+        :param k: How many Sonnets to return
+        :param excluded: IDs of documents that must not be returned (e.g. deleted ones)
+        :param statistics: N, average length and document frequencies to score with
+                           (default: those of this index)
+        :return: (Sonnet, score) pairs, best first (ties are broken by the lower Sonnet ID)
+        """
+        if k <= 0 or not self.document_lengths:
             return []
 
-        # Initialize 'matching_ids' to the set of doc IDs where the first token appears
-        matching_ids = set(self[first_token])
+        if statistics is None:
+            document_count = len(self.document_lengths)
+            average_length = sum(self.document_lengths.values()) / document_count
+            shortest_length = min(self.document_lengths.values())
+        else:
+            document_count = statistics.document_count
+            average_length = statistics.average_length
+            shortest_length = statistics.shortest_length
 
-        # Go through the remaining tokens in the query
-        for token in query_tokens[1:]:
+        # Gather one cursor per distinct query token that occurs in the index
+        terms = []
+        for token in set(query.terms()):
             if token not in self:
-                # If any token doesn't exist, there can be no matches for that token
-                return []
-            # Intersect the current matching IDs with the set of IDs for this token
-            matching_ids = matching_ids.intersection(self[token])
+                continue
+            postings, frequencies = self.postings_with_frequencies(token)
+            if statistics is None:
+                document_frequency = len(postings)
+            else:
+                document_frequency = statistics.document_frequencies[token]
+            idf = math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            # The score grows with tf and shrinks with the document length, so the largest tf in the
+            # shortest document gives an upper bound for this token
+            max_frequency = max(frequencies)
+            upper_bound = idf * max_frequency * (BM25_K1 + 1) / (
+                max_frequency + BM25_K1 * (1 - BM25_B + BM25_B * shortest_length / average_length))
+            terms.append(_RankedTerm(postings, frequencies, idf, upper_bound))
+
+        if not terms:
+            return []
+
+        # Sort by upper bound; prefix_bounds[i] = sum of the upper bounds of terms[0..i]
+        terms.sort(key=lambda term: term.upper_bound)
+        prefix_bounds = list(itertools.accumulate(term.upper_bound for term in terms))
+
+        def score(term: _RankedTerm, frequency: int, doc_id: int) -> float:
+            normalization = 1 - BM25_B + BM25_B * self.document_lengths[doc_id] / average_length
+            return term.idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * normalization)
+
+        heap = []               # Min-heap of (score, -doc_id): heap[0] is the weakest of the top k
+        threshold = 0.0         # A document must score more than this to enter a full heap
+        first_essential = 0     # terms[:first_essential] are non-essential
+
+        while first_essential < len(terms):
+            # The next candidate is the smallest current doc ID among the essential terms
+            current_ids = [term.current() for term in terms[first_essential:] if term.current() is not None]
+            if not current_ids:
+                break  # All essential posting lists are exhausted
+            doc_id = min(current_ids)
+
+            # Score the candidate with the essential terms (and move their cursors past it)
+            total = 0.0
+            for term in terms[first_essential:]:
+                if term.current() == doc_id:
+                    total += score(term, term.frequencies[term.position], doc_id)
+                    term.position += 1
+
+            if doc_id in excluded:
+                continue
+
+            # Add the non-essential terms, strongest first, as long as the document can still make it
+            for i in range(first_essential - 1, -1, -1):
+                if total + prefix_bounds[i] <= threshold:
+                    break  # Even the best case for the remaining terms cannot beat the threshold
+                term = terms[i]
+                term.position = gallop_to(term.postings, doc_id, term.position)
+                if term.current() == doc_id:
+                    total += score(term, term.frequencies[term.position], doc_id)
+
+            if len(heap) < k:
+                heapq.heappush(heap, (total, -doc_id))
+            elif total > threshold:
+                heapq.heapreplace(heap, (total, -doc_id))
+            else:
+                continue
+
+            if len(heap) == k:
+                # The threshold went up: more low-scoring terms may have become non-essential
+                threshold = heap[0][0]
+                while first_essential < len(terms) and prefix_bounds[first_essential] <= threshold:
+                    first_essential += 1
+
+        ranked = sorted(heap, reverse=True)
+        return [(self.documents_by_id[-negative_id], total) for total, negative_id in ranked]
+
+    def save(self, path: str):
+        """
+        Writes this index to a single binary file that MappedIndex can open with mmap.
+
+        File layout (all integers little-endian):
+          - Header: magic b"SNIX", format version, number of terms, number of documents
+          - Term dictionary: one fixed-size entry per term, sorted by the term's UTF-8 bytes,
+            holding where the term text and its posting list live in the file
+          - Document lengths: one (doc ID, number of tokens) pair per document (for BM25)
+          - Term texts: all terms concatenated as UTF-8
+          - Posting lists: sorted document IDs, stored as gaps (deltas) encoded as varints,
+            each followed by the term frequency in that document (also a varint)
+
+        :param path: Where to write the index file (an existing file is overwritten)
+        """
+        # Sort the terms by their encoded bytes, so the dictionary can be binary-searched byte-wise
+        terms = sorted(self, key=lambda token: token.encode("utf-8"))
+        write_index_file(path, ((token, *self.postings_with_frequencies(token)) for token in terms),
+                         self.document_lengths)
+
+    @classmethod
+    def open(cls, path: str, documents: list[Sonnet]) -> "MappedIndex":
+        """
+        Opens an index file written by Index.save() without rebuilding anything.
+        :param path: The index file
+        :param documents: The Sonnet objects the stored document IDs refer to
+        :return: A read-only MappedIndex that answers search() straight from the file
+        """
+        return MappedIndex(path, documents)
+
+# --------------------------------------------------------------------------------
+# PART 5a: POSITIONAL INDEX (for phrase queries)
+# --------------------------------------------------------------------------------
+
+class PositionalIndex(Index):
+    """
+    An inverted index that additionally records WHERE each token occurs:
+      positions[token][doc ID] = list of (line number, token offset within that line)
+
+    Phrase queries like "summer's day" are then checked from these positions instead of
+    re-tokenizing the candidate Sonnets.
+    """
+
+    def __init__(self, documents: list[Sonnet]):
+        self.positions = {}           # Must exist before Index.__init__ calls add()
+        super().__init__(documents)
+
+    def add(self, document: Sonnet, tokens: list[str] = None):
+        """
+        Adds the Sonnet like Index.add() does, and records the position of every token.
+        """
+        super().add(document, tokens)
+
+        # Collect this Sonnet's positions first, so adding the same Sonnet again replaces them
+        document_positions = {}
+        for line_number, line_tokens in enumerate(tokenizer.tokenize_lines(document.lines)):
+            for offset, token in enumerate(line_tokens):
+                document_positions.setdefault(token, []).append((line_number, offset))
+
+        for token, token_positions in document_positions.items():
+            self.positions.setdefault(token, {})[document.id] = token_positions
+
+    def phrase_in_document(self, doc_id: int, phrase: list[str]) -> bool:
+        """
+        The phrase occurs if, for some position (line, offset) of its first token, the i-th token
+        of the phrase occurs at (line, offset + i).
+        """
+        try:
+            following = [set(self.positions[token][doc_id]) for token in phrase[1:]]
+            first_positions = self.positions[phrase[0]][doc_id]
+        except KeyError:
+            return False  # Some token of the phrase doesn't occur in this document at all
+
+        for line_number, offset in first_positions:
+            if all((line_number, offset + i) in positions for i, positions in enumerate(following, start=1)):
+                return True
+        return False
+
+# --------------------------------------------------------------------------------
+# PART 5b: COMPRESSED, MEMORY-MAPPED INDEX FILE
+# --------------------------------------------------------------------------------
+
+# Every index file starts with these bytes, so we never try to read some unrelated file
+INDEX_FILE_MAGIC = b"SNIX"
+INDEX_FILE_VERSION = 3
 
-            # If at any point the intersection is empty, no documents can match all tokens
-            if not matching_ids:
+# Header: magic, version, number of terms, number of documents
+_INDEX_HEADER = struct.Struct("<4sIII")
+# Term dictionary entry: term offset, term length, postings offset, postings length, document frequency
+# (the term length is 32 bits: a token may be longer than 64 KiB, e.g. a "word" without any spaces)
+_TERM_ENTRY = struct.Struct("<QIQII")
+# Document length entry: doc ID, number of tokens
+_DOCUMENT_LENGTH = struct.Struct("<II")
+
+
+def write_index_file(path: str, postings, document_lengths: dict[int, int]):
+    """
+    Writes an index file in the layout described in Index.save().
+    The file is written under a temporary name and renamed when complete, so a reader (or a
+    crash) never sees a half-written index at 'path'.
+    :param postings: (term, sorted doc IDs, term frequencies) triples, ordered by the terms' UTF-8 bytes;
+                     may be a generator, so a merge can produce one posting list at a time
+    :param document_lengths: doc ID -> number of tokens
+    """
+    entries = bytearray()
+    term_blob = bytearray()
+    postings_size = 0
+
+    # The posting lists are the bulk of the file: they go straight to a side file, so only the
+    # term dictionary and the term texts are held in memory until the section sizes are known.
+    # Offsets are first collected relative to the start of their section ...
+    temporary_path = path + ".tmp"
+    postings_path = path + ".postings.tmp"
+    try:
+        with open(postings_path, "w+b") as postings_file:
+            for term, doc_ids, frequencies in postings:
+                encoded_term = term.encode("utf-8")
+                encoded_postings = encode_postings(doc_ids, frequencies)
+                entries += _TERM_ENTRY.pack(len(term_blob), len(encoded_term),
+                                            postings_size, len(encoded_postings), len(doc_ids))
+                term_blob += encoded_term
+                postings_file.write(encoded_postings)
+                postings_size += len(encoded_postings)
+
+            # ... and then shifted to absolute file offsets, now that the section sizes are known
+            term_count = len(entries) // _TERM_ENTRY.size
+            lengths_start = _INDEX_HEADER.size + len(entries)
+            term_blob_start = lengths_start + len(document_lengths) * _DOCUMENT_LENGTH.size
+            postings_start = term_blob_start + len(term_blob)
+
+            with open(temporary_path, "wb") as file:
+                file.write(_INDEX_HEADER.pack(INDEX_FILE_MAGIC, INDEX_FILE_VERSION, term_count, len(document_lengths)))
+                for term_offset, term_length, postings_offset, postings_length, document_frequency \
+                        in _TERM_ENTRY.iter_unpack(entries):
+                    file.write(_TERM_ENTRY.pack(term_blob_start + term_offset, term_length,
+                                                postings_start + postings_offset, postings_length, document_frequency))
+                for doc_id, length in sorted(document_lengths.items()):
+                    file.write(_DOCUMENT_LENGTH.pack(doc_id, length))
+                file.write(term_blob)
+                postings_file.seek(0)
+                shutil.copyfileobj(postings_file, file)
+                file.flush()
+                os.fsync(file.fileno())   # The data must be on disk before the rename makes it visible
+    finally:
+        os.remove(postings_path)
+    os.replace(temporary_path, path)
+
+
+def _append_varint(out: bytearray, value: int):
+    """
+    Appends a varint: 7 bits per byte, lowest bits first; the high bit says "more bytes follow".
+    Small numbers (the common case) therefore take a single byte.
+    """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_postings(doc_ids, frequencies) -> bytes:
+    """
+    Encodes a sorted list of document IDs as varint-encoded gaps, each followed by its term frequency.
+    E.g. IDs [3, 7, 130] with frequencies [1, 2, 1] -> varints 3,1, 4,2, 123,1 -> one byte each here.
+    """
+    out = bytearray()
+    previous = 0
+    for doc_id, frequency in zip(doc_ids, frequencies):
+        _append_varint(out, doc_id - previous)
+        _append_varint(out, frequency)
+        previous = doc_id
+    return bytes(out)
+
+
+def decode_postings(buffer, start: int, end: int) -> tuple[array, array]:
+    """
+    Reverses encode_postings() for the bytes buffer[start:end] (works on bytes and mmap objects).
+    :return: The sorted array of document IDs and the parallel array of term frequencies
+    """
+    doc_ids = array(POSTINGS_TYPECODE)
+    frequencies = array(POSTINGS_TYPECODE)
+    previous = 0
+    value = 0
+    shift = 0
+    for byte in buffer[start:end]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            # More bytes of this varint follow
+            shift += 7
+            continue
+        # Varints alternate: a gap (turned back into an absolute document ID), then a frequency
+        if len(doc_ids) == len(frequencies):
+            previous += value
+            doc_ids.append(previous)
+        else:
+            frequencies.append(value)
+        value = 0
+        shift = 0
+    return doc_ids, frequencies
+
+
+class MappedIndex(Index):
+    """
+    A read-only inverted index backed by a file written with Index.save().
+
+    The file is memory-mapped, so opening it costs almost nothing: only the pages that a
+    search actually touches are read from disk. Looking up a token binary-searches the sorted
+    term dictionary and decodes just that token's posting list, so search() (inherited from
+    Index) works unchanged without ever holding all postings in Python sets.
+    """
+
+    def __init__(self, path: str, documents: list[Sonnet]):
+        """
+        :param path: The index file
+        :param documents: The Sonnet objects the stored document IDs refer to
+        """
+        super().__init__([])         # Start as an empty Index, nothing is tokenized
+        self.documents = documents   # The Sonnets that search() returns
+        self.documents_by_id = {document.id: document for document in documents}
+
+        self.file = open(path, "rb")
+        if os.fstat(self.file.fileno()).st_size < _INDEX_HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path} is too short to be a sonnet index file")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.term_count, document_count = _INDEX_HEADER.unpack_from(self.buffer, 0)
+        if magic != INDEX_FILE_MAGIC or version != INDEX_FILE_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {INDEX_FILE_VERSION} sonnet index file")
+
+        # A truncated file: the sections the header announces must all be there
+        lengths_start = _INDEX_HEADER.size + self.term_count * _TERM_ENTRY.size
+        expected_size = lengths_start + document_count * _DOCUMENT_LENGTH.size
+        if self.term_count and len(self.buffer) >= expected_size:
+            _, _, postings_offset, postings_length, _ = self._entry(self.term_count - 1)
+            expected_size = max(expected_size, postings_offset + postings_length)
+        if len(self.buffer) < expected_size:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+        # Document lengths are one small pair per document, so we read them right away (for BM25)
+        self.document_lengths = dict(_DOCUMENT_LENGTH.iter_unpack(
+            self.buffer[lengths_start:lengths_start + document_count * _DOCUMENT_LENGTH.size]))
+
+    def close(self):
+        """Releases the memory map and the underlying file."""
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _entry(self, position: int) -> tuple[int, int, int, int, int]:
+        """Reads the term dictionary entry at the given position (0 .. term_count - 1)."""
+        return _TERM_ENTRY.unpack_from(self.buffer, _INDEX_HEADER.size + position * _TERM_ENTRY.size)
+
+    def _term(self, position: int) -> bytes:
+        """Reads the UTF-8 bytes of the term at the given position."""
+        term_offset, term_length, _, _, _ = self._entry(position)
+        return self.buffer[term_offset:term_offset + term_length]
+
+    def _find(self, token: str):
+        """
+        Binary-searches the sorted term dictionary.
+        :return: The term's dictionary entry, or None if the token is not in the index
+        """
+        if not isinstance(token, str):
+            return None
+        key = token.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._term(low) == key:
+            return self._entry(low)
+        return None
+
+    def __contains__(self, token) -> bool:
+        return self._find(token) is not None
+
+    def __getitem__(self, token: str) -> array:
+        return self.postings_with_frequencies(token)[0]
+
+    def postings_with_frequencies(self, token: str) -> tuple[array, array]:
+        entry = self._find(token)
+        if entry is None:
+            raise KeyError(token)
+        _, _, postings_offset, postings_length, _ = entry
+        return decode_postings(self.buffer, postings_offset, postings_offset + postings_length)
+
+    def get(self, token: str, default=None):
+        return self[token] if token in self else default
+
+    def __len__(self) -> int:
+        return self.term_count
+
+    def __iter__(self):
+        # Terms come out in the stored (sorted) order
+        for position in range(self.term_count):
+            yield self._term(position).decode("utf-8")
+
+    def keys(self):
+        return list(self)
+
+    # The dict storage inherited from Index stays empty, so everything that would read it directly
+    # (views, comparison, copying, dict(...)) is answered from the file instead
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return len(self) == len(other) and all(token in other and other[token] == postings
+                                               for token, postings in self.items())
+
+    def __ne__(self, other) -> bool:
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.file.name!r}, {self.term_count} terms)"
+
+    def copy(self) -> dict[str, array]:
+        return dict(self.items())
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("A MappedIndex is read-only; build an Index and save() it instead")
+
+    __setitem__ = __delitem__ = __ior__ = update = setdefault = pop = popitem = clear = _read_only
+
+    def document_frequency(self, token: str) -> int:
+        """How many documents contain the token, without decoding its posting list."""
+        entry = self._find(token)
+        return entry[4] if entry is not None else 0
+
+    def add(self, document: Sonnet, tokens: list[str] = None):
+        self._read_only()
+
+# --------------------------------------------------------------------------------
+# PART 5c: SEGMENTED INDEX (incremental updates instead of full rebuilds)
+# --------------------------------------------------------------------------------
+
+class SegmentedIndex:
+    """
+    An index that can be updated in place, organized like Lucene:
+      - New Sonnets go into a small in-memory Index (the "buffer")
+      - When the buffer holds 'flush_threshold' Sonnets it is flushed: saved as a new, immutable
+        index file (a "segment") and opened as a MappedIndex
+      - Deleting a Sonnet only marks it as deleted ("tombstone") in the segment that holds it;
+        updating a Sonnet is a delete followed by an add
+      - When there are 'merge_factor' or more segments, a background thread merges the smallest
+        ones into a single new segment, leaving out tombstoned Sonnets
+
+    The list of segments and their tombstones is kept in 'manifest.json' inside the directory, so the
+    index can be reopened later. Sonnets still in the buffer are only persisted by flush() or close().
+    """
+
+    MANIFEST_NAME = "manifest.json"
+    BUFFER = ""   # Location name of Sonnets that are still in the in-memory buffer
+
+    def __init__(self, directory: str, documents: list[Sonnet] = (),
+                 flush_threshold: int = 64, merge_factor: int = 4):
+        """
+        :param directory: Where the segment files and the manifest are stored (created if needed)
+        :param documents: The Sonnet objects the stored document IDs refer to (when reopening an index)
+        :param flush_threshold: Flush the buffer once it holds this many Sonnets
+        :param merge_factor: Merge segments once there are this many
+        """
+        self.directory = directory
+        self.flush_threshold = flush_threshold
+        self.merge_factor = merge_factor
+
+        # Doc-ID -> Sonnet table shared by all segments (for returning results and checking phrases)
+        self.documents_by_id = {document.id: document for document in documents}
+
+        self.lock = threading.RLock()     # Guards the segment list, the tombstones and the buffer
+        self.merge_lock = threading.Lock()  # Only one merge at a time, so two merges never pick the same segments
+        self.merge_thread = None          # The background merge thread while it runs, else None
+        self.segments = {}                # segment name -> MappedIndex, oldest first
+        self.deleted = {}                 # segment name -> set of tombstoned doc IDs
+        self.live = {}                    # doc ID -> name of the segment (or BUFFER) holding it
+        self.next_segment = 0
+        self.obsolete = []                # Merged-away (name, segment) pairs, released when no search uses them
+        self.readers = Counter()          # segment name -> number of running searches that use the segment
+        self.buffer = Index([])
+
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, self.MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as file:
+                manifest = json.load(file)
+            self.next_segment = manifest["next_segment"]
+            for entry in manifest["segments"]:
+                self._open_segment(entry["name"], set(entry["deleted"]))
+
+        # Segment files the manifest doesn't know (a crash during a merge, or before obsolete
+        # segments were removed) will never be used again
+        for file_name in os.listdir(directory):
+            if re.fullmatch(r"segment_\d+\.index(\.tmp|\.postings\.tmp)?", file_name) \
+                    and file_name not in self.segments:
+                os.remove(os.path.join(directory, file_name))
+
+    def _open_segment(self, name: str, deleted: set[int]):
+        segment = MappedIndex(os.path.join(self.directory, name), [])
+        segment.documents_by_id = self.documents_by_id   # Share the one doc-ID table
+        self.segments[name] = segment
+        self.deleted[name] = deleted
+        for doc_id in segment.document_lengths:
+            if doc_id not in deleted:
+                self.live[doc_id] = name
+
+    def _write_manifest(self):
+        """Atomically replaces the manifest (write a temporary file, then rename it)."""
+        manifest = {
+            "next_segment": self.next_segment,
+            "segments": [{"name": name, "deleted": sorted(self.deleted[name])} for name in self.segments],
+        }
+        manifest_path = os.path.join(self.directory, self.MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w") as file:
+            json.dump(manifest, file, indent=4)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _new_segment_name(self) -> str:
+        name = f"segment_{self.next_segment}.index"
+        self.next_segment += 1
+        return name
+
+    def __len__(self) -> int:
+        """Number of live (not deleted) Sonnets."""
+        return len(self.live)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self.live
+
+    def add(self, document: Sonnet):
+        """
+        Adds a Sonnet. If a Sonnet with the same ID is already indexed, it is replaced.
+        """
+        with self.lock:
+            self.delete(document.id)
+            self.documents_by_id[document.id] = document
+            self.buffer.add(document)
+            self.live[document.id] = self.BUFFER
+            if len(self.buffer.document_lengths) >= self.flush_threshold:
+                self.flush()
+
+    # Updating is the same as adding: the old version is tombstoned first
+    update = add
+
+    def delete(self, doc_id: int) -> bool:
+        """
+        Removes a Sonnet from the index.
+        :return: True if the Sonnet was indexed, False otherwise
+        """
+        with self.lock:
+            location = self.live.pop(doc_id, None)
+            if location is None:
+                return False
+            if location == self.BUFFER:
+                # The buffer is small: simply rebuild it without this Sonnet
+                remaining = [self.buffer.documents_by_id[other] for other in self.buffer.document_lengths
+                             if other != doc_id]
+                self.buffer = Index(remaining)
+            else:
+                self.deleted[location].add(doc_id)
+                self._write_manifest()
+            return True
+
+    def flush(self):
+        """
+        Writes the buffered Sonnets as a new segment and starts a background merge if needed.
+        """
+        with self.lock:
+            if self.buffer.document_lengths:
+                name = self._new_segment_name()
+                self.buffer.save(os.path.join(self.directory, name))
+                self.buffer = Index([])
+                self._open_segment(name, set())
+                self._write_manifest()
+            if len(self.segments) >= self.merge_factor:
+                self.merge_in_background()
+
+    def merge_in_background(self):
+        """
+        Starts a background thread that merges until fewer than 'merge_factor' segments are left.
+        If one is already running, it will see the new segments before it stops.
+        """
+        with self.lock:
+            if self.merge_thread is not None:
+                return
+            self.merge_thread = threading.Thread(target=self._merge_while_needed, daemon=True)
+            self.merge_thread.start()
+
+    def _merge_while_needed(self):
+        while True:
+            with self.lock:
+                # Decided under the lock, so a flush() either sees the thread still running or starts a new one
+                if len(self.segments) < self.merge_factor:
+                    self.merge_thread = None
+                    return
+            self.merge()
+
+    def merge(self):
+        """
+        Merge policy: combine the 'merge_factor' smallest segments (counting live Sonnets only)
+        into one new segment. Searches keep running meanwhile; only the final swap takes the lock.
+        """
+        with self.merge_lock:
+            self._merge_smallest()
+
+    def _merge_smallest(self):
+        with self.lock:
+            if len(self.segments) < 2:
+                return
+            by_size = sorted(self.segments, key=lambda name: len(self.segments[name].document_lengths)
+                             - len(self.deleted[name]))
+            names = by_size[:self.merge_factor]
+            sources = [(name, self.segments[name], set(self.deleted[name])) for name in names]
+            merged_name = self._new_segment_name()
+
+        # The expensive part runs without the lock: the source segments are immutable files
+        document_lengths = {}
+        for _, segment, deleted in sources:
+            for doc_id, length in segment.document_lengths.items():
+                if doc_id not in deleted:
+                    document_lengths[doc_id] = length
+
+        def merged_postings():
+            terms = sorted(set().union(*(segment for _, segment, _ in sources)),
+                           key=lambda token: token.encode("utf-8"))
+            for token in terms:
+                entries = []
+                for _, segment, deleted in sources:
+                    if token in segment:
+                        doc_ids, frequencies = segment.postings_with_frequencies(token)
+                        entries.extend((doc_id, frequency) for doc_id, frequency in zip(doc_ids, frequencies)
+                                       if doc_id not in deleted)
+                if entries:
+                    entries.sort()
+                    yield (token, array(POSTINGS_TYPECODE, (doc_id for doc_id, _ in entries)),
+                           array(POSTINGS_TYPECODE, (frequency for _, frequency in entries)))
+
+        write_index_file(os.path.join(self.directory, merged_name), merged_postings(), document_lengths)
+
+        with self.lock:
+            # Sonnets deleted while we were merging are tombstoned in the new segment
+            late_deletes = set()
+            for name, _, deleted in sources:
+                late_deletes |= self.deleted[name] - deleted
+
+            # The merged-away segments may still be in use by running searches, so they are
+            # only closed and removed once the last of those searches is done
+            for name, segment, _ in sources:
+                del self.segments[name]
+                del self.deleted[name]
+                self.obsolete.append((name, segment))
+
+            self._open_segment(merged_name, late_deletes)
+            self._write_manifest()
+            self._release_obsolete()
+
+    def _release_obsolete(self):
+        """Closes and removes the merged-away segments that no running search uses anymore (under the lock)."""
+        still_used = []
+        for name, segment in self.obsolete:
+            if self.readers[name]:
+                still_used.append((name, segment))
+            else:
+                segment.close()
+                os.remove(os.path.join(self.directory, name))
+        self.obsolete = still_used
+
+    def wait_for_merges(self):
+        """Blocks until the background merging has finished."""
+        with self.lock:
+            thread = self.merge_thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        """Flushes the buffer, waits for merges and releases all segment files."""
+        self.flush()
+        self.wait_for_merges()
+        with self.lock:
+            for segment in self.segments.values():
+                segment.close()
+            for name, segment in self.obsolete:
+                segment.close()
+                os.remove(os.path.join(self.directory, name))
+            self.obsolete = []
+
+    @contextlib.contextmanager
+    def _snapshot(self):
+        """
+        The current segments (and the buffer) with their tombstones, taken under the lock.
+        Used as 'with self._snapshot() as parts:'; until the block ends, a merge doesn't close these segments.
+        """
+        with self.lock:
+            names = list(self.segments)
+            parts = [(self.segments[name], set(self.deleted[name])) for name in names]
+            parts.append((self.buffer, set()))
+            self.readers.update(names)
+        try:
+            yield parts
+        finally:
+            with self.lock:
+                self.readers.subtract(names)
+                self.readers += Counter()   # Drops the names that are no longer read
+                self._release_obsolete()
+
+    def search(self, query: "Query") -> list[Sonnet]:
+        """
+        Same as Index.search(), evaluated segment by segment with tombstoned Sonnets left out.
+        """
+        node = query.parse()
+        if node is None:
+            return []
+
+        matching_ids = []
+        with self._snapshot() as parts:
+            for segment, deleted in parts:
+                matching_ids.extend(doc_id for doc_id in segment.evaluate(node) if doc_id not in deleted)
+
+        return [self.documents_by_id[doc_id] for doc_id in sorted(matching_ids)]
+
+    def statistics(self, parts: list[tuple[Index, set[int]]], tokens: set[str]) -> _CollectionStatistics:
+        """
+        BM25 statistics over the live Sonnets of all parts (segments and buffer), as one index
+        holding only those Sonnets would have them.
+        """
+        lengths = [length for part, deleted in parts
+                   for doc_id, length in part.document_lengths.items() if doc_id not in deleted]
+        document_frequencies = {}
+        for token in tokens:
+            count = 0
+            for part, deleted in parts:
+                if token in part:
+                    postings = part[token]
+                    count += len(postings) - (sum(1 for doc_id in postings if doc_id in deleted) if deleted else 0)
+            document_frequencies[token] = count
+        return _CollectionStatistics(len(lengths), sum(lengths) / len(lengths) if lengths else 0.0,
+                                     min(lengths, default=0), document_frequencies)
+
+    def rank(self, query: "Query", k: int = 10) -> list[tuple[Sonnet, float]]:
+        """
+        Same as Index.rank() over the live Sonnets. Every part is scored with the same
+        index-wide statistics (N, average length, document frequencies), so the parts'
+        top k can simply be merged, whatever the flush and merge history was.
+        """
+        with self._snapshot() as parts:
+            statistics = self.statistics(parts, set(query.terms()))
+            if statistics.document_count == 0:
                 return []
+            ranked = []
+            for segment, deleted in parts:
+                ranked.extend(segment.rank(query, k, excluded=deleted, statistics=statistics))
+        ranked.sort(key=lambda pair: (-pair[1], pair[0].id))
+        return ranked[:k]
+
+# --------------------------------------------------------------------------------
+# PART 5d: PARALLEL INDEX BUILD (sharded over a process pool)
+# --------------------------------------------------------------------------------
 
-        # Convert the set of matching IDs to Sonnet objects (by looking them up in 'self.documents')
-        matched_sonnets = []
-        for doc_id in sorted(matching_ids):
-            for sonnet in self.documents:
-                if sonnet.id == doc_id:
-                    matched_sonnets.append(sonnet)
-                    break  # Break once we found the matching Sonnet for this ID
+def _index_shard(shard: list[Sonnet]) -> tuple[dict, dict, dict]:
+    """
+    Runs in a worker process: builds an ordinary Index over one shard of the Sonnets and sends back
+    only the compact parts (posting arrays, frequency arrays, document lengths), not the Sonnets.
+    """
+    partial = Index(shard)
+    return dict(partial), partial.frequencies, partial.document_lengths
 
-        # Return the final list of matched Sonnet objects
-        return matched_sonnets
+
+def build_index_parallel(documents: list[Sonnet], workers: int = None, shard_size: int = None) -> Index:
+    """
+    Builds the same Index as Index(documents), but tokenizes and stems the shards in parallel
+    in a ProcessPoolExecutor (threads wouldn't help: stemming is pure Python and holds the GIL).
+
+    :param documents: A list of Sonnet objects
+    :param workers: Number of worker processes (default: number of CPU cores)
+    :param shard_size: Sonnets per shard (default: about four shards per worker, for load balancing)
+    :return: An Index equal to the serial build (same tokens in the same order, same postings)
+    """
+    workers = workers or os.cpu_count() or 1
+    shard_size = shard_size or max(1, -(-len(documents) // (workers * 4)))   # Ceiling division
+    shards = [documents[i:i + shard_size] for i in range(0, len(documents), shard_size)]
+
+    index = Index([])
+    index.documents = documents
+    index.documents_by_id = {document.id: document for document in documents}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() returns the shards' results in shard order, which keeps the merge deterministic
+        for postings, frequencies, document_lengths in executor.map(_index_shard, shards):
+            index.document_lengths.update(document_lengths)
+
+            for token, doc_ids in postings.items():
+                existing = index.get(token)
+                if existing is None:
+                    index[token] = doc_ids
+                    index.frequencies[token] = frequencies[token]
+                elif existing[-1] < doc_ids[0]:
+                    # The usual case (Sonnets in ID order): this shard's IDs simply come after
+                    existing.extend(doc_ids)
+                    index.frequencies[token].extend(frequencies[token])
+                else:
+                    # Overlapping ID ranges: merge by ID, a later shard wins (like a later add() would)
+                    merged = dict(zip(existing, index.frequencies[token]))
+                    merged.update(zip(doc_ids, frequencies[token]))
+                    index[token] = array(POSTINGS_TYPECODE, sorted(merged))
+                    index.frequencies[token] = array(POSTINGS_TYPECODE, (merged[doc_id] for doc_id in sorted(merged)))
+
+    return index
 
 # --------------------------------------------------------------------------------
 # PART 6: QUERY CLASS
@@ -267,13 +1550,283 @@ class Query(Document):
         Document.tokenize() method can be used the same way as with sonnets.
         """
         super().__init__([query])
+        self.text = query
+
+    def parse(self) -> "QueryNode":
+        """
+        Parses the query text into a tree of query nodes. Grammar (operators are UPPERCASE,
+        so the lowercase words "and", "or" and "not" can still be searched for):
+
+            or_expr  := and_expr ("OR" and_expr)*
+            and_expr := not_expr (["AND"] not_expr)*          (plain words mean AND)
+            not_expr := "NOT" not_expr | "(" or_expr ")" | '"' phrase '"' | word
+
+        Words and phrase words go through the same tokenization as the Sonnets.
+        E.g. 'love AND (hate OR NOT "summer's day")' ->
+             And([Term('love'), Or([Term('hate'), Not(Phrase(['summer', 'day']))])])
+
+        :return: The root node, or None if the query contains no searchable words
+        :raises ValueError: If parentheses are unbalanced or an operator is missing its operand
+        """
+        return _QueryParser(self.text).parse()
+
+    def terms(self) -> list[str]:
+        """
+        The tokens that a matching Sonnet should contain (words and phrase words that are not
+        negated), used for ranking. Plain queries give the same tokens as tokenize().
+        """
+        def collect(node, negated: bool, out: list[str]):
+            if isinstance(node, Term):
+                if not negated:
+                    out.append(node.token)
+            elif isinstance(node, Phrase):
+                if not negated:
+                    out.extend(node.tokens)
+            elif isinstance(node, Not):
+                collect(node.child, not negated, out)
+            elif node is not None:
+                for child in node.children:
+                    collect(child, negated, out)
+            return out
+
+        return collect(self.parse(), False, [])
 
 # --------------------------------------------------------------------------------
-# PART 7: BUILD THE FINAL INDEX USING ALL SONNETS
+# PART 6b: QUERY LANGUAGE (nodes and parser)
 # --------------------------------------------------------------------------------
 
-# Create the inverted index from our list of Sonnet objects
-index = Index(sonnet_instances)
+class QueryNode:
+    """Base class of the nodes of a parsed query."""
+
+
+class Term(QueryNode):
+    """A single (stemmed) token."""
+
+    def __init__(self, token: str):
+        self.token = token
+
+    def __repr__(self):
+        return f"Term({self.token!r})"
+
+
+class Phrase(QueryNode):
+    """Tokens that must occur consecutively on one line, e.g. "summer's day"."""
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+
+    def __repr__(self):
+        return f"Phrase({self.tokens!r})"
+
+
+class And(QueryNode):
+    def __init__(self, children: list[QueryNode]):
+        self.children = children
+
+    def __repr__(self):
+        return f"And({self.children!r})"
+
+
+class Or(QueryNode):
+    def __init__(self, children: list[QueryNode]):
+        self.children = children
+
+    def __repr__(self):
+        return f"Or({self.children!r})"
+
+
+class Not(QueryNode):
+    def __init__(self, child: QueryNode):
+        self.child = child
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+
+class _QueryParser:
+    """
+    A small recursive-descent parser for Query.parse().
+    """
+
+    # A quoted phrase (the closing quote may be missing), a parenthesis, or any other word
+    TOKEN_PATTERN = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+    OPERATORS = {"AND", "OR", "NOT"}
+
+    def __init__(self, text: str):
+        self.lexemes = self.TOKEN_PATTERN.findall(text)
+        self.position = 0
+
+    def peek(self):
+        return self.lexemes[self.position] if self.position < len(self.lexemes) else None
+
+    def next(self):
+        lexeme = self.peek()
+        self.position += 1
+        return lexeme
+
+    def parse(self):
+        if not self.lexemes:
+            return None   # An empty (or all-whitespace) query simply finds nothing
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected {self.peek()!r} in query")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == "OR":
+            self.next()
+            children.append(self.parse_and())
+        return self.combine(Or, children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() is not None and self.peek() not in ("OR", ")"):
+            if self.peek() == "AND":
+                self.next()
+            children.append(self.parse_not())
+        return self.combine(And, children)
+
+    def parse_not(self):
+        lexeme = self.next()
+        if lexeme is None or lexeme in ("AND", "OR", ")"):
+            raise ValueError("Missing search term in query")
+        if lexeme == "NOT":
+            child = self.parse_not()
+            return Not(child) if child is not None else None
+        if lexeme == "(":
+            node = self.parse_or()
+            if self.next() != ")":
+                raise ValueError("Missing ')' in query")
+            return node
+        if lexeme.startswith('"'):
+            tokens = tokenizer.tokenize([lexeme.strip('"')])
+            if len(tokens) == 1:
+                return Term(tokens[0])
+            return Phrase(tokens) if tokens else None
+        # A plain word: it may vanish completely (e.g. "!"), then it's simply ignored
+        tokens = tokenizer.tokenize([lexeme])
+        return Term(tokens[0]) if tokens else None
+
+    @staticmethod
+    def combine(node_class, children: list):
+        """Drops empty parts; a single remaining child needs no And/Or around it."""
+        children = [child for child in children if child is not None]
+        if not children:
+            return None
+        if len(children) == 1:
+            return children[0]
+        return node_class(children)
+
+# --------------------------------------------------------------------------------
+# PART 7: SEARCH ENGINE (fetches the sonnets and builds the index lazily)
+# --------------------------------------------------------------------------------
+
+class SearchEngine:
+    """
+    Everything the search needs, created only when it is first used:
+      - sonnets: downloaded (if the source changed) and parsed on first access
+      - index: opened from the snapshot file if its metadata says it was built by this index
+        format from the current sonnets file (memory-mapped, nothing is tokenized); otherwise
+        - or if the snapshot can't be read - built once and saved as the new snapshot
+
+    Creating a SearchEngine does no work at all, so worker processes and tests can import this
+    module and use Document.tokenize() without fetching or indexing anything.
+    """
+
+    def __init__(self, source: str = url, sonnets_path: str = sonnets_path,
+                 index_path: str = "shakespeare_sonnets.index"):
+        """
+        :param source: URL (or local JSON/JSONL file) the sonnets come from
+        :param sonnets_path: Where a downloaded copy of the sonnets is cached
+        :param index_path: Where the index snapshot is stored (delete it to force a rebuild)
+        """
+        self.source = source
+        self.sonnets_path = sonnets_path
+        self.index_path = index_path
+        self._sonnets = None
+        self._index = None
+
+    @property
+    def sonnets(self) -> list[Sonnet]:
+        if self._sonnets is None:
+            path = self.source
+            if self.source.startswith(("http://", "https://")):
+                path = self.sonnets_path
+                self.refresh()
+            # Stream the stored sonnets from disk, converting each record into a Sonnet object
+            self._sonnets = list(iter_sonnets(path)) if os.path.exists(path) else []
+        return self._sonnets
+
+    def refresh(self) -> bool:
+        """
+        Makes sure we have an up-to-date copy of the sonnets on disk.
+        :return: True if a new version was downloaded
+        """
+        import requests
+        try:
+            if download_if_changed(self.source, self.sonnets_path):
+                print(f"Fetched and stored the sonnets in {self.sonnets_path}.")
+                return True
+            return False
+        except requests.RequestException as error:
+            # If the download failed, display an error message (an earlier copy is still used if there is one)
+            print(f"Failed to fetch sonnets: {error}")
+            return False
+
+    def snapshot_metadata(self) -> dict:
+        """What a snapshot built right now would be built from: format, source and sonnets file state."""
+        sonnets_file = self.sonnets_path if self.source.startswith(("http://", "https://")) else self.source
+        status = os.stat(sonnets_file) if os.path.exists(sonnets_file) else None
+        return {
+            "version": INDEX_FILE_VERSION,
+            "source": self.source,
+            "sonnets_mtime_ns": status.st_mtime_ns if status else None,
+            "sonnets_size": status.st_size if status else None,
+        }
+
+    def snapshot_is_fresh(self) -> bool:
+        """The snapshot can be used if it was built, in this format, from exactly the current sonnets file."""
+        try:
+            with open(self.index_path + ".meta.json", "r") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return os.path.exists(self.index_path) and stored == self.snapshot_metadata()
+
+    def save_snapshot(self, index: Index):
+        """Saves the index and then (atomically) its metadata; the metadata is what marks it as usable."""
+        metadata_path = self.index_path + ".meta.json"
+        try:
+            index.save(self.index_path)
+            with open(metadata_path + ".tmp", "w") as file:
+                json.dump(self.snapshot_metadata(), file)
+            os.replace(metadata_path + ".tmp", metadata_path)
+        except (OSError, struct.error) as error:
+            # struct.error: a number doesn't fit the file format; the index is still usable in memory
+            print(f"Could not save the index snapshot: {error}")
+
+    @property
+    def index(self) -> Index:
+        if self._index is None:
+            sonnets = self.sonnets   # May download a newer version, which makes the snapshot stale
+            if self.snapshot_is_fresh():
+                try:
+                    self._index = Index.open(self.index_path, sonnets)
+                except (OSError, ValueError, struct.error) as error:
+                    print(f"Ignoring unreadable index snapshot {self.index_path}: {error}")
+            if self._index is None:
+                # Create the inverted index from our list of Sonnet objects
+                # (with positions, so phrase queries don't need to re-tokenize Sonnets in this session)
+                self._index = PositionalIndex(sonnets)
+                self.save_snapshot(self._index)
+        return self._index
+
+    def search(self, text: str) -> list[Sonnet]:
+        return self.index.search(Query(text))
+
+    def rank(self, text: str, k: int = 10) -> list[tuple[Sonnet, float]]:
+        return self.index.rank(Query(text), k)
 
 # --------------------------------------------------------------------------------
 # PART 8: USER INTERFACE (INTERACTIVE LOOP)
@@ -287,12 +1840,15 @@ def main():
       - Type '0' to quit
     """
 
+    # Fetching the sonnets and building (or opening) the index happens here, not at import time
+    engine = SearchEngine()
+    index = engine.index
+    print(f"Loaded {len(engine.sonnets)} sonnets.")
+
     print("\nWelcome to Shakespeare Sonnets Search!")
+    print('Combine words with AND, OR, NOT and (...), search phrases with "...".')
     print("Type '0' to quit.\n")
 
-    # We already built 'index' outside main(), but some might prefer doing it inside.
-    # We'll use the global 'index' here.
-
     # Infinite loop to repeatedly ask for user queries
     while True:
         # Prompt user for input
@@ -307,7 +1863,11 @@ def main():
         query = Query(user_input)
 
         # Use the 'search' method of our index to find matching Sonnets
-        results = index.search(query)
+        try:
+            results = index.search(query)
+        except ValueError as error:
+            print(f"--> Invalid query: {error}\n")
+            continue
 
         # If we found no matching sonnets, notify the user
         if not results:
@@ -321,6 +1881,180 @@ def main():
             for sonnet in results:
                 print(sonnet, "\n")
 
+# --------------------------------------------------------------------------------
+# PART 9: ASYNC HTTP/JSON SEARCH SERVER
+# --------------------------------------------------------------------------------
+
+def normalize_query(node: QueryNode) -> str:
+    """
+    Turns a parsed query into a canonical string, used as the result cache key.
+    The tokens are already stemmed, and the parts of AND/OR are sorted and de-duplicated,
+    so e.g. "love hate", "Hate  LOVES" and "hate AND love" all share one cache entry.
+    """
+    if isinstance(node, Term):
+        return node.token
+    if isinstance(node, Phrase):
+        return '"' + " ".join(node.tokens) + '"'
+    if isinstance(node, Not):
+        return f"NOT({normalize_query(node.child)})"
+    operator = "AND" if isinstance(node, And) else "OR"
+    return f"{operator}(" + ",".join(sorted(set(normalize_query(child) for child in node.children))) + ")"
+
+
+class SearchServer:
+    """
+    An asyncio HTTP server answering JSON search requests over one shared, read-only index:
+
+        GET /search?q=love+hate                  -> all matching Sonnets (like Index.search())
+        GET /search?q=love+hate&mode=rank&k=10   -> the k best Sonnets by BM25 (like Index.rank())
+
+    Response: {"query": ..., "count": ..., "results": [{"id": ..., "title": ..., ("score": ...)}]}
+
+    - The event loop only parses requests and writes responses; evaluating a query runs on a
+      thread pool, so a slow query does not hold up other connections
+    - Finished results go into an LRU cache keyed by the normalized, stemmed query; every response
+      still echoes the query text of its own request
+    - Identical queries that arrive while one is still being evaluated wait for that evaluation
+      instead of starting their own
+    - HTTP/1.1 keep-alive connections are supported, so clients can reuse a connection
+    """
+
+    def __init__(self, index: Index, cache_size: int = 4096, workers: int = None):
+        """
+        :param index: The index to search (shared by all connections, never modified)
+        :param cache_size: Maximum number of cached responses
+        :param workers: Threads for query evaluation (default: chosen by ThreadPoolExecutor)
+        """
+        self.index = index
+        self.cache_size = cache_size
+        self.cache = OrderedDict()      # cache key -> (result count, encoded JSON results list)
+        self.pending = {}               # cache key -> Future of an evaluation in progress
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def evaluate(self, text: str, mode: str, k: int) -> tuple[int, bytes]:
+        """Runs on a worker thread: evaluates the query and encodes its JSON results list."""
+        if mode == "rank":
+            results = [{"id": sonnet.id, "title": sonnet.title, "score": round(score, 6)}
+                       for sonnet, score in self.index.rank(Query(text), k)]
+        else:
+            results = [{"id": sonnet.id, "title": sonnet.title} for sonnet in self.index.search(Query(text))]
+        return len(results), json.dumps(results).encode("utf-8")
+
+    async def answer(self, text: str, mode: str, k: int) -> bytes:
+        """
+        Returns the response body for a query, with its results from the cache if possible.
+        :raises ValueError: If the query is not well-formed
+        """
+        node = Query(text).parse()
+        key = (mode, k if mode == "rank" else None, normalize_query(node) if node is not None else "")
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)   # Mark as most recently used
+        else:
+            future = self.pending.get(key)
+            if future is None:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self.executor, self.evaluate, text, mode, k)
+                self.pending[key] = future
+                try:
+                    # shield(): if this client disconnects, the evaluation still finishes for the others
+                    cached = await asyncio.shield(future)
+                finally:
+                    del self.pending[key]
+                self.cache[key] = cached
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)   # Evict the least recently used results
+            else:
+                # Somebody else is already evaluating the same query: share their result
+                cached = await asyncio.shield(future)
+
+        # The envelope is built per request, so each client gets its own query text back
+        count, results = cached
+        return b'{"query": %s, "count": %d, "results": %s}' % (json.dumps(text).encode("utf-8"), count, results)
+
+    async def handle_request(self, method: str, target: str) -> tuple[int, bytes]:
+        """:return: HTTP status code and JSON body for one request"""
+        if method != "GET":
+            return 405, b'{"error": "only GET is supported"}'
+        parsed = urllib.parse.urlsplit(target)
+        if parsed.path != "/search":
+            return 404, b'{"error": "not found"}'
+
+        parameters = urllib.parse.parse_qs(parsed.query)
+        text = parameters.get("q", [""])[0]
+        mode = parameters.get("mode", ["search"])[0]
+        try:
+            k = int(parameters.get("k", ["10"])[0])
+            if mode not in ("search", "rank"):
+                raise ValueError("mode must be 'search' or 'rank'")
+            return 200, await self.answer(text, mode, k)
+        except ValueError as error:
+            return 400, json.dumps({"error": str(error)}).encode("utf-8")
+        except Exception:
+            return 500, b'{"error": "internal server error"}'
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves the requests of one client connection until it is closed."""
+        try:
+            while True:
+                # readline() raises ValueError for a line longer than the reader's limit (64 KiB)
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    await self.reject(writer, 414)
+                    break
+                if not request_line:
+                    break   # The client closed the connection
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self.reject(writer, 400)
+                    break
+
+                # Read the headers (we only care about 'Connection'); requests have no body
+                keep_alive = parts[2] == "HTTP/1.1"
+                try:
+                    while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        name, _, value = header.decode("latin-1").partition(":")
+                        if name.strip().lower() == "connection":
+                            keep_alive = value.strip().lower() == "keep-alive"
+                except ValueError:
+                    await self.reject(writer, 431)
+                    break
+
+                status, body = await self.handle_request(parts[0], parts[1])
+                writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                             + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass   # The client went away; nothing to answer
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def reject(writer: asyncio.StreamWriter, status: int):
+        """Answers a request that can't be read with an empty error response; the connection is closed after it."""
+        writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                     f"Content-Length: 0\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8000):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving Shakespeare Sonnets Search on http://{host}:{port}/search?q=...")
+        async with server:
+            await server.serve_forever()
+
+
 # This ensures the user interface only runs if this script is the 'main' file being executed
+# ('python Exercise_5.py serve [port]' starts the HTTP server instead of the console loop)
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        server = SearchServer(SearchEngine().index)
+        asyncio.run(server.serve_forever(port=int(sys.argv[2]) if len(sys.argv) > 2 else 8000))
+    else:
+        main()
@@ -0,0 +1,264 @@
+import asyncio
+import http.server
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import Exercise_5
+
+
+class SonnetSource(http.server.BaseHTTPRequestHandler):
+    """
+    A stand-in for the PoetryDB server: serves 'body' with 'etag' and understands conditional and Range requests.
+    'cut' interrupts the next response after that many bytes, 'range_mode' makes Range requests misbehave
+    ("ignore start" answers 206 from byte 0, "unsatisfiable" answers 416).
+    """
+    body = b""
+    etag = '"v1"'
+    cut = None
+    range_mode = None
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        source = type(self)
+        source.requests.append({name: self.headers.get(name) for name in ("If-None-Match", "Range", "If-Range")})
+        if self.headers.get("If-None-Match") == source.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        status = 200
+        if self.headers.get("Range") and self.headers.get("If-Range") == source.etag:
+            if source.range_mode == "unsatisfiable":
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+            if source.range_mode != "ignore start":
+                start = int(self.headers["Range"][len("bytes="):-1])
+        body = source.body[start:]
+
+        self.send_response(status)
+        self.send_header("ETag", source.etag)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(source.body) - 1}/{len(source.body)}")
+        self.end_headers()
+        if source.cut is not None:
+            self.wfile.write(body[:source.cut])
+            self.wfile.flush()
+            source.cut = None
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+class DownloadIfChangedTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SonnetSource)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/sonnets"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        SonnetSource.body = bytes(range(256)) * 1000
+        SonnetSource.etag = '"v1"'
+        SonnetSource.cut = None
+        SonnetSource.range_mode = None
+        SonnetSource.requests = []
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sonnets.json")
+
+    def download(self) -> bool:
+        return Exercise_5.download_if_changed(self.url, self.path, chunk_size=4096)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def interrupt_first_download(self):
+        SonnetSource.cut = 100000
+        with self.assertRaises(Exception):
+            self.download()
+        self.resume_from = os.path.getsize(self.path + ".part")
+        self.assertTrue(0 < self.resume_from < len(SonnetSource.body))
+
+    def test_unchanged_source_answers_304(self):
+        self.assertTrue(self.download())
+        self.assertFalse(self.download())
+        self.assertEqual(SonnetSource.requests[-1]["If-None-Match"], '"v1"')
+        self.assertEqual(self.read(), SonnetSource.body)
+
+    def test_interrupted_download_is_resumed(self):
+        self.interrupt_first_download()
+        self.assertTrue(self.download())
+        self.assertEqual(SonnetSource.requests[-1]["Range"], f"bytes={self.resume_from}-")
+        self.assertEqual(self.read(), SonnetSource.body)
+        self.assertFalse(os.path.exists(self.path + ".part"))
+
+    def test_new_etag_is_fetched_again(self):
+        self.assertTrue(self.download())
+        SonnetSource.etag = '"v2"'
+        SonnetSource.body = b"new sonnets" * 1000
+        self.assertTrue(self.download())
+        self.assertEqual(self.read(), SonnetSource.body)
+        self.assertFalse(self.download())
+
+    def test_source_changed_during_interruption(self):
+        self.interrupt_first_download()
+        SonnetSource.etag = '"v2"'
+        SonnetSource.body = b"new sonnets" * 1000
+        self.assertTrue(self.download())
+        self.assertEqual(self.read(), SonnetSource.body)
+
+    def test_unsatisfiable_range_fetches_everything(self):
+        self.interrupt_first_download()
+        SonnetSource.range_mode = "unsatisfiable"
+        self.assertTrue(self.download())
+        self.assertEqual(SonnetSource.requests[-1]["Range"], None)
+        self.assertEqual(self.read(), SonnetSource.body)
+
+    def test_wrong_content_range_fetches_everything(self):
+        self.interrupt_first_download()
+        SonnetSource.range_mode = "ignore start"
+        self.assertTrue(self.download())
+        self.assertEqual(SonnetSource.requests[-1]["Range"], None)
+        self.assertEqual(self.read(), SonnetSource.body)
+
+
+class CountingReader(io.StringIO):
+    """A text file that remembers how many characters were read from it."""
+    characters_read = 0
+
+    def read(self, size=-1):
+        text = super().read(size)
+        self.characters_read += len(text)
+        return text
+
+
+class JsonRecordsTest(unittest.TestCase):
+    records = [{"title": f"Sonnet {number}: \u00e9\"quoted\"", "lines": ["a", "b"], "linecount": "2.5e1"}
+               for number in range(1, 40)]
+
+    def test_records_split_across_chunks(self):
+        array_text = json.dumps(self.records, indent=2)
+        lines_text = "\n".join(json.dumps(record) for record in self.records)
+        for chunk_size in (1, 7, 64, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(Exercise_5.iter_json_records(io.StringIO(array_text), chunk_size)),
+                                 self.records)
+                self.assertEqual(list(Exercise_5.iter_json_records(io.StringIO(lines_text), chunk_size)),
+                                 self.records)
+
+    def test_corrupt_record_is_reported_without_reading_on(self):
+        valid = ", ".join(json.dumps(record) for record in self.records * 500)
+        text = '[{"title": "Sonnet 1: x", "lines": [}, ' + valid + "]"
+        file = CountingReader(text)
+        with self.assertRaises(ValueError):
+            list(Exercise_5.iter_json_records(file, chunk_size=256))
+        self.assertLessEqual(file.characters_read, 512)
+
+    def test_truncated_file_is_an_error(self):
+        text = json.dumps(self.records)[:-20]
+        with self.assertRaises(ValueError):
+            list(Exercise_5.iter_json_records(io.StringIO(text), chunk_size=64))
+
+
+class IndexFileTest(unittest.TestCase):
+    def test_token_longer_than_64_kib_is_saved(self):
+        long_word = "a" * 70000
+        sonnets = [Exercise_5.Sonnet({"title": "Sonnet 1: Long", "lines": [f"love {long_word} hate"]}),
+                   Exercise_5.Sonnet({"title": "Sonnet 2: Short", "lines": ["love and beauty"]})]
+        index = Exercise_5.Index(sonnets)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "long.index")
+            index.save(path)
+            with Exercise_5.MappedIndex(path, sonnets) as mapped:
+                self.assertEqual(mapped, index)
+                self.assertIn(long_word, mapped)
+                self.assertEqual([sonnet.id for sonnet in mapped.search(Exercise_5.Query(long_word))], [1])
+
+
+class QueryParserTest(unittest.TestCase):
+    def parse(self, text: str):
+        return Exercise_5.Query(text).parse()
+
+    def test_empty_query_finds_nothing(self):
+        self.assertIsNone(self.parse(""))
+        self.assertIsNone(self.parse("   "))
+        index = Exercise_5.Index([Exercise_5.Sonnet({"title": "Sonnet 1: Love", "lines": ["Love is love"]})])
+        self.assertEqual(index.search(Exercise_5.Query("")), [])
+        self.assertEqual(index.rank(Exercise_5.Query("   ")), [])
+
+    def test_dangling_operator_is_an_error(self):
+        for text in ("love AND", "love OR", "AND love", "NOT"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                self.parse(text)
+
+    def test_unbalanced_parentheses_are_an_error(self):
+        for text in ("(love", "love)", "(love OR hate", "()"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                self.parse(text)
+
+    def test_not_only_queries(self):
+        self.assertEqual(repr(self.parse("NOT love")), "Not(Term('love'))")
+        self.assertEqual(repr(self.parse("NOT NOT love")), "Not(Not(Term('love')))")
+        self.assertIsNone(self.parse("NOT !"))
+
+
+class SearchServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        sonnets = [Exercise_5.Sonnet({"title": "Sonnet 1: Love", "lines": ["Love is not love"]}),
+                   Exercise_5.Sonnet({"title": "Sonnet 2: Summer", "lines": ["A summer's day"]})]
+        self.server = Exercise_5.SearchServer(Exercise_5.Index(sonnets))
+        self.listener = await asyncio.start_server(self.server.handle_connection, "127.0.0.1", 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+
+    async def request(self, raw: bytes) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=10)
+        writer.close()
+        return response
+
+    async def test_search(self):
+        response = await self.request(b"GET /search?q=love HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        body = json.loads(response.partition(b"\r\n\r\n")[2])
+        self.assertEqual([result["id"] for result in body["results"]], [1])
+
+    async def test_empty_query(self):
+        response = await self.request(b"GET /search?q= HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        self.assertEqual(json.loads(response.partition(b"\r\n\r\n")[2])["count"], 0)
+
+    async def test_too_long_request_line(self):
+        response = await self.request(b"GET /search?q=" + b"a" * 100000 + b" HTTP/1.1\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 414 "))
+
+    async def test_too_long_header(self):
+        response = await self.request(b"GET /search?q=love HTTP/1.1\r\nX-Long: " + b"a" * 100000 + b"\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 431 "))
+
+
+if __name__ == "__main__":
+    unittest.main()